@@ -0,0 +1,83 @@
+import os
+import json
+import time
+import threading
+
+# 账号定位索引：记录门户账户树中每个账号链接的节点选择器，下次直接点击，不再在搜索框输入账号；
+# 节点不在页面上（未命中）时回退到搜索，并在搜索选中后重新抓取当前可见的账号节点
+INDEX_FILE = "account_index.json"
+
+_file_lock = threading.Lock()
+
+# 抓取账户树中可见的账号链接：优先用 id，其次 href，最后用链接文本定位
+CRAWL_SCRIPT = """
+() => {
+    const result = [];
+    for (const a of document.querySelectorAll('a')) {
+        const match = (a.innerText || '').match(/\\d{8,}/);
+        if (!match || !a.offsetParent) continue;
+        const href = a.getAttribute('href');
+        let selector;
+        if (a.id) selector = '#' + CSS.escape(a.id);
+        else if (href && href !== '#' && !href.startsWith('javascript')) selector = 'a[href="' + href.replace(/"/g, '\\\\"') + '"]';
+        else selector = 'a:text-is("' + a.innerText.trim().replace(/"/g, '\\\\"') + '")';
+        result.push({account: match[0], selector: selector});
+    }
+    return result;
+}
+"""
+
+class AccountIndex:
+    """账号 → 账户树节点选择器的磁盘缓存，每个页面一个实例"""
+
+    def __init__(self, project_root):
+        self.path = os.path.join(project_root, INDEX_FILE)
+        self.entries = self._read()
+        self.hits = 0
+        self.misses = 0
+
+    def _read(self):
+        if not os.path.exists(self.path):
+            return {}
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _save(self, updates):
+        # 多个线程各自持有实例，写入前合并磁盘上的最新内容
+        with _file_lock:
+            entries = self._read()
+            entries.update(updates)
+            tmp_path = self.path + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(entries, f, ensure_ascii=False, indent=2)
+            os.replace(tmp_path, self.path)
+        self.entries = entries
+
+    def select(self, page, account):
+        """按索引直接点击账号节点，节点不在页面上或不唯一时返回 False（未命中）"""
+        entry = self.entries.get(account)
+        if entry:
+            node = page.locator(entry["selector"])
+            if node.count() == 1 and node.is_visible():
+                node.click()
+                self.hits += 1
+                return True
+        self.misses += 1
+        return False
+
+    def crawl(self, page, xiangmu):
+        """抓取当前可见的账号节点写入索引，返回新增或变化的条目数"""
+        updates = {}
+        for item in page.evaluate(CRAWL_SCRIPT):
+            entry = self.entries.get(item["account"])
+            if not entry or entry["selector"] != item["selector"]:
+                updates[item["account"]] = {"selector": item["selector"], "xiangmu": xiangmu, "updated_at": time.time()}
+        if updates:
+            self._save(updates)
+        return len(updates)
+
+    def log_summary(self, log_local):
+        log_local(f"账号定位索引：直接定位 {self.hits} 次，回退搜索 {self.misses} 次，已索引 {len(self.entries)} 个账号")
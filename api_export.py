@@ -0,0 +1,231 @@
+import os
+import json
+import threading
+from urllib.parse import unquote_plus
+
+# 接口导出：录制“凭证导出”“对账单导出”点击时发出的请求，之后用 context.request 直接重放
+TEMPLATE_FILE = "api_templates.json"
+
+# kind -> (中文名称, 文件头校验)
+EXPORT_KINDS = {
+    "huidan": ("银行回单", (b"%PDF",)),
+    "liushui": ("银行流水", (b"PK", b"\xd0\xcf\x11\xe0")),
+}
+
+# 重放时由浏览器上下文自动生成或不能手动设置的请求头
+SKIP_HEADERS = {"cookie", "content-length", "host", "connection", "accept-encoding"}
+
+BINARY_TYPES = ("application/pdf", "application/vnd", "application/octet-stream", "application/x-download", "application/msexcel")
+
+_template_lock = threading.Lock()
+
+def _placeholders(account, kaishiriqi, jieshuriqi):
+    return [
+        ("{{account}}", account),
+        ("{{start}}", kaishiriqi),
+        ("{{end}}", jieshuriqi),
+        ("{{start_compact}}", kaishiriqi.replace("-", "")),
+        ("{{end_compact}}", jieshuriqi.replace("-", "")),
+    ]
+
+def _match(value, targets, hits):
+    """字段值恰好等于账号或日期时返回对应占位符并计数，否则返回 None"""
+    for placeholder, target in targets:
+        if value == target:
+            hits[placeholder] = hits.get(placeholder, 0) + 1
+            return placeholder
+    return None
+
+def _parameterize_query(query, targets, hits):
+    fields = []
+    for field in query.split("&"):
+        name, eq, value = field.partition("=")
+        placeholder = _match(unquote_plus(value), targets, hits) if eq else None
+        fields.append(f"{name}={placeholder}" if placeholder else field)
+    return "&".join(fields)
+
+def _parameterize_json(node, targets, hits):
+    if isinstance(node, dict):
+        return {key: _parameterize_json(value, targets, hits) for key, value in node.items()}
+    if isinstance(node, list):
+        return [_parameterize_json(value, targets, hits) for value in node]
+    if isinstance(node, str):
+        return _match(node, targets, hits) or node
+    return node
+
+def _parameterize(text, targets, hits, is_url=False):
+    """按字段替换：URL 查询参数、表单字段或 JSON 字段的值恰好等于账号/日期时换成占位符
+
+    不做子串替换，避免日期或账号出现在其他参数里时被误改；hits 统计每个占位符替换的字段数。
+    """
+    if not text:
+        return text
+    if is_url:
+        base, sep, query = text.partition("?")
+        return base + sep + _parameterize_query(query, targets, hits) if sep else text
+    if text.lstrip().startswith(("{", "[")):
+        try:
+            return json.dumps(_parameterize_json(json.loads(text), targets, hits), ensure_ascii=False)
+        except ValueError:
+            pass
+    return _parameterize_query(text, targets, hits)
+
+def _fill(text, account, kaishiriqi, jieshuriqi):
+    if not text:
+        return text
+    for placeholder, value in _placeholders(account, kaishiriqi, jieshuriqi):
+        text = text.replace(placeholder, value)
+    return text
+
+def load_templates(project_root):
+    """读取已录制的接口模板"""
+    path = os.path.join(project_root, TEMPLATE_FILE)
+    if not os.path.exists(path):
+        return {}
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            templates = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    # 旧版按子串替换录制的模板可能缺少日期参数（如单日录制），重放会截断数据，视为未录制
+    return {kind: template for kind, template in templates.items() if _has_date_fields(template)}
+
+def _has_date_fields(template):
+    text = (template.get("url") or "") + (template.get("post_data") or "")
+    return ("{{start}}" in text or "{{start_compact}}" in text) and ("{{end}}" in text or "{{end_compact}}" in text)
+
+def save_template(project_root, kind, template):
+    """保存某一导出类型的接口模板"""
+    path = os.path.join(project_root, TEMPLATE_FILE)
+    with _template_lock:
+        templates = load_templates(project_root)
+        templates[kind] = template
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(templates, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, path)
+
+class ApiCapture:
+    """在一次导出点击期间记录页面发出的请求及其响应类型"""
+
+    def __init__(self, page, enabled=True):
+        self.page = page
+        self.enabled = enabled
+        self.requests = []
+        self.binary_responses = []
+
+    def _on_request(self, request):
+        if request.resource_type in ("xhr", "fetch", "document", "other"):
+            self.requests.append(request)
+
+    def _on_response(self, response):
+        headers = response.headers
+        content_type = headers.get("content-type", "")
+        if "attachment" in headers.get("content-disposition", "") or content_type.startswith(BINARY_TYPES):
+            self.binary_responses.append(response.request)
+
+    def __enter__(self):
+        if self.enabled:
+            self.page.on("request", self._on_request)
+            self.page.on("response", self._on_response)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if self.enabled:
+            self.page.remove_listener("request", self._on_request)
+            self.page.remove_listener("response", self._on_response)
+        return False
+
+    def save(self, project_root, kind, download, account, kaishiriqi, jieshuriqi, log_local):
+        """根据下载结果挑选触发下载的请求并保存为模板"""
+        request = None
+        if not download.url.startswith(("blob:", "data:")):
+            request = next((r for r in reversed(self.requests) if r.url == download.url), None)
+        if request is None and self.binary_responses:
+            request = self.binary_responses[-1]
+        if request is None:
+            log_local(f"未捕获到{EXPORT_KINDS[kind][0]}的导出请求，无法录制接口模板")
+            return False
+        if kaishiriqi == jieshuriqi:
+            # 单日范围无法区分开始和结束日期字段，录制后重放会一直只取一天
+            log_local(f"单日日期范围无法录制{EXPORT_KINDS[kind][0]}接口模板，请用多日范围运行一次")
+            return False
+        targets = _placeholders(account, kaishiriqi, jieshuriqi)
+        hits = {}
+        url = _parameterize(request.url, targets, hits, is_url=True)
+        post_data = _parameterize(request.post_data, targets, hits)
+        repeated = [placeholder for placeholder, count in hits.items() if count > 1]
+        if repeated:
+            log_local(f"{EXPORT_KINDS[kind][0]}导出请求中{'、'.join(repeated)}对应多个字段，无法确定参数，不录制接口模板：{request.url}")
+            return False
+        missing = [name for name, keys in (("账号", ("{{account}}",)), ("开始日期", ("{{start}}", "{{start_compact}}")), ("结束日期", ("{{end}}", "{{end_compact}}")))
+                   if not any(key in hits for key in keys)]
+        if missing:
+            log_local(f"{EXPORT_KINDS[kind][0]}导出请求中未找到{'、'.join(missing)}参数，无法录制接口模板：{request.url}")
+            return False
+        headers = {k: v for k, v in request.headers.items() if k.lower() not in SKIP_HEADERS and not k.startswith(":")}
+        save_template(project_root, kind, {"method": request.method, "url": url, "headers": headers, "post_data": post_data})
+        log_local(f"已录制{EXPORT_KINDS[kind][0]}导出接口：{request.method} {request.url.split('?')[0]}")
+        return True
+
+class LiveHeaders:
+    """跟踪页面最近一次接口请求的请求头，重放时用来替换模板中可能过期的令牌"""
+
+    def __init__(self, page):
+        self.headers = {}
+        self.watch(page)
+
+    def watch(self, page):
+        """监听页面的请求（回收页面后对新页面再次调用）"""
+        page.on("request", self._on_request)
+
+    def _on_request(self, request):
+        if request.resource_type in ("xhr", "fetch"):
+            self.headers = {k: v for k, v in request.headers.items() if k.lower() not in SKIP_HEADERS and not k.startswith(":")}
+
+def replay_export(context, template, kind, account, kaishiriqi, jieshuriqi, out_path, live_headers=None):
+    """按模板直接请求导出接口并写入 out_path，响应不是预期文件时返回失败原因"""
+    headers = dict(template.get("headers") or {})
+    if live_headers:
+        for key, value in live_headers.items():
+            if key.lower() not in ("content-type", "accept"):
+                headers[key] = value
+    response = context.request.fetch(
+        _fill(template["url"], account, kaishiriqi, jieshuriqi),
+        method=template.get("method", "GET"),
+        headers=headers,
+        data=_fill(template.get("post_data"), account, kaishiriqi, jieshuriqi),
+    )
+    if not response.ok:
+        return f"HTTP {response.status}"
+    body = response.body()
+    if not body.startswith(EXPORT_KINDS[kind][1]):
+        return f"响应不是{EXPORT_KINDS[kind][0]}文件（{response.headers.get('content-type', '未知类型')}）"
+    tmp_path = out_path + ".part"
+    with open(tmp_path, "wb") as f:
+        f.write(body)
+    os.replace(tmp_path, out_path)
+    return None
+
+def api_export_account(context, project_root, download_path, xiangmu, account, kaishiriqi, jieshuriqi, log_local, live_headers=None):
+    """用接口模板导出一个账号的回单和流水，全部成功返回 True，否则由调用方回退到页面操作"""
+    templates = load_templates(project_root)
+    missing = [kind for kind in EXPORT_KINDS if kind not in templates]
+    if missing:
+        log_local(f"缺少接口模板（{', '.join(EXPORT_KINDS[k][0] for k in missing)}），请先以 capture 模式运行一次")
+        return False
+    targets = {
+        "huidan": os.path.join(download_path, xiangmu, "银行回单", f"{xiangmu}_银行回单_{kaishiriqi}_{jieshuriqi}.pdf"),
+        "liushui": os.path.join(download_path, xiangmu, "银行流水", f"{xiangmu}_银行流水_{kaishiriqi}_{jieshuriqi}.xlsx"),
+    }
+    for kind, out_path in targets.items():
+        os.makedirs(os.path.dirname(out_path), exist_ok=True)
+        try:
+            error = replay_export(context, templates[kind], kind, account, kaishiriqi, jieshuriqi, out_path, live_headers)
+        except Exception as e:
+            error = str(e)
+        if error:
+            log_local(f"接口导出{EXPORT_KINDS[kind][0]}失败（项目：{xiangmu}）：{error}，回退到页面导出")
+            return False
+        log_local(f"{EXPORT_KINDS[kind][0]}接口导出完成：{os.path.basename(out_path)}")
+    return True
@@ -0,0 +1,64 @@
+import os
+import pandas as pd
+from excel_rows import HEADER_ROWS, cell_text, read_rows, write_rows
+
+# 批量导出：多选一组账号后只查询、导出一次流水，再按账号列拆回各项目的流水文件
+
+# 流水表中账号列的常见列名关键字
+ACCOUNT_COLUMN_HINTS = ("账号", "账户")
+
+def make_batches(jobs, batch_size):
+    """把任务按顺序分组：同一组日期范围相同，且不超过 batch_size 个"""
+    batches = []
+    for job in jobs:
+        if batches and len(batches[-1]) < batch_size and batches[-1][0][2:] == job[2:]:
+            batches[-1].append(job)
+        else:
+            batches.append([job])
+    return batches
+
+def find_account_column(df, accounts):
+    """返回取值包含这些账号的列名，优先检查列名带“账号/账户”的列，找不到返回 None"""
+    accounts = set(accounts)
+    columns = sorted(df.columns, key=lambda c: not any(h in str(c) for h in ACCOUNT_COLUMN_HINTS))
+    for column in columns:
+        values = set(df[column].dropna().astype(str).str.strip())
+        if values & accounts:
+            return column
+    return None
+
+def split_liushui(combined_path, download_path, batch, log_local, manifest=None):
+    """按账号列把合并导出的流水拆到 <项目>/银行流水，返回已写出的 (项目, 账号) 集合
+
+    只拆出账号列中实际出现的账号，其余账号不写文件也不登记，仍按未完成处理。
+    """
+    accounts = [account for _, account, _, _ in batch]
+    # 只用文本表查找账号列；拆分按行复制单元格原值，长账号不会被转成数字丢失精度
+    text = pd.read_excel(combined_path, header=0, dtype=str)
+    column = find_account_column(text, accounts)
+    if column is None:
+        log_local("合并流水中未找到账号列，无法拆分")
+        return set()
+    position = list(text.columns).index(column)
+    data = read_rows(combined_path)[HEADER_ROWS:]
+    keys = [cell_text(row[position]) if position < len(row) else "" for row in data]
+    present = set(keys)
+    written = set()
+    matched = 0
+    for xiangmu, account, kaishiriqi, jieshuriqi in batch:
+        if account not in present:
+            # 合并导出中没有该账号可能是漏选或查询不全，不记为完成，逐个导出时重试
+            log_local(f"合并流水中没有账号 {account} 的记录，留待逐个导出")
+            continue
+        rows = [row for row, key in zip(data, keys) if key == account]
+        matched += len(rows)
+        target = os.path.join(download_path, xiangmu, "银行流水", f"{xiangmu}_银行流水_{kaishiriqi}_{jieshuriqi}.xlsx")
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        write_rows(target, rows, template=combined_path)
+        if manifest:
+            manifest.record(xiangmu, account, "liushui", kaishiriqi, jieshuriqi, target)
+        written.add((xiangmu, account))
+        log_local(f"已拆分流水：{os.path.basename(target)}（{len(rows)} 行）")
+    if matched != len(data):
+        log_local(f"合并流水中有 {len(data) - matched} 行不属于本组账号，已忽略")
+    return written
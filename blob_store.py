@@ -0,0 +1,62 @@
+import os
+import threading
+from manifest import file_sha256
+
+# 内容寻址存储：导出文件按 SHA-256 存放在 <下载目录>/.blobs，项目目录下的文件是指向它的硬链接，
+# 重复导出相同内容不再额外占用磁盘；(项目, 账号, 类型, 日期范围) → 哈希 的索引即导出清单。
+# 硬链接共享同一份内容，重新写入已登记的文件时不能原地覆盖，必须先删除或写临时文件后 os.replace
+BLOB_DIR = ".blobs"
+
+class BlobStore:
+    """按内容去重的文件存储"""
+
+    def __init__(self, download_path):
+        self.root = os.path.join(download_path, BLOB_DIR)
+        os.makedirs(self.root, exist_ok=True)
+        self.lock = threading.Lock()
+        self.stored = 0
+        self.reused = 0
+        self.saved_bytes = 0
+
+    def blob_path(self, sha256):
+        return os.path.join(self.root, sha256[:2], sha256)
+
+    def intern(self, path):
+        """把 path 纳入存储并返回其哈希：内容已存在时把 path 换成指向已有对象的硬链接"""
+        sha256 = file_sha256(path)
+        blob = self.blob_path(sha256)
+        with self.lock:
+            if os.path.exists(blob):
+                if not os.path.samefile(blob, path):
+                    tmp_path = path + ".part"
+                    if os.path.exists(tmp_path):
+                        os.remove(tmp_path)
+                    os.link(blob, tmp_path)
+                    os.replace(tmp_path, path)
+                    self.reused += 1
+                    self.saved_bytes += os.path.getsize(blob)
+            else:
+                os.makedirs(os.path.dirname(blob), exist_ok=True)
+                try:
+                    os.link(path, blob)
+                    self.stored += 1
+                except OSError:
+                    # 不支持硬链接时不去重，文件保持原样
+                    pass
+        return sha256
+
+    def prune(self):
+        """删除已没有项目文件引用的对象（硬链接数为 1），返回删除个数"""
+        removed = 0
+        with self.lock:
+            for dirpath, _, filenames in os.walk(self.root):
+                for name in filenames:
+                    blob = os.path.join(dirpath, name)
+                    if os.stat(blob).st_nlink <= 1:
+                        os.remove(blob)
+                        removed += 1
+        return removed
+
+    def log_summary(self, log_local):
+        removed = self.prune()
+        log_local(f"去重存储：新增 {self.stored} 个对象，复用 {self.reused} 个（节省 {self.saved_bytes / 1024 / 1024:.1f} MB），清理 {removed} 个无引用对象")
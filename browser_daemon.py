@@ -0,0 +1,103 @@
+import os
+import json
+import time
+import signal
+import socket
+import subprocess
+import urllib.request
+
+# 常驻浏览器：GUI 首次运行时启动一个带远程调试端口的 Chromium，之后的导出和登录通过 CDP 连接复用，
+# 登录状态保存在独立的用户目录中，不必每次冷启动浏览器并重新登录
+DAEMON_DIR = "browser_daemon"
+ENDPOINT_FILE = "endpoint.json"
+START_TIMEOUT = 30
+
+_process = None
+
+def _endpoint_path(project_root):
+    return os.path.join(project_root, DAEMON_DIR, ENDPOINT_FILE)
+
+def _free_port():
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def _alive(endpoint):
+    """调试端口是否可访问"""
+    try:
+        with urllib.request.urlopen(f"{endpoint}/json/version", timeout=1) as resp:
+            return resp.status == 200
+    except OSError:
+        return False
+
+def read_endpoint(project_root):
+    """返回正在运行的常驻浏览器地址，不存在或已退出时返回 None"""
+    path = _endpoint_path(project_root)
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            endpoint = json.load(f)["endpoint"]
+    except (OSError, ValueError, KeyError):
+        return None
+    return endpoint if _alive(endpoint) else None
+
+def start_daemon(playwright, project_root, log_local):
+    """启动常驻 Chromium（有界面，便于手动登录和桌面打印），返回调试地址"""
+    global _process
+    endpoint = read_endpoint(project_root)
+    if endpoint:
+        return endpoint
+    daemon_dir = os.path.join(project_root, DAEMON_DIR)
+    os.makedirs(daemon_dir, exist_ok=True)
+    port = _free_port()
+    endpoint = f"http://127.0.0.1:{port}"
+    args = [
+        playwright.chromium.executable_path,
+        f"--remote-debugging-port={port}",
+        f"--user-data-dir={os.path.join(daemon_dir, 'profile')}",
+        "--no-first-run",
+        "--no-default-browser-check",
+        "--start-maximized",
+        "about:blank",
+    ]
+    log_local("启动常驻浏览器...")
+    _process = subprocess.Popen(args, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.monotonic() + START_TIMEOUT
+    while not _alive(endpoint):
+        if _process.poll() is not None or time.monotonic() >= deadline:
+            raise RuntimeError(f"常驻浏览器启动失败（退出码：{_process.poll()}）")
+        time.sleep(0.2)
+    with open(_endpoint_path(project_root), "w", encoding="utf-8") as f:
+        json.dump({"endpoint": endpoint, "pid": _process.pid, "started_at": time.time()}, f)
+    log_local(f"常驻浏览器已启动：{endpoint}")
+    return endpoint
+
+def connect_daemon(playwright, project_root, log_local):
+    """连接常驻浏览器（未运行时先启动），返回 Browser；关闭该对象只断开连接，不会退出浏览器"""
+    started = time.monotonic()
+    endpoint = start_daemon(playwright, project_root, log_local)
+    browser = playwright.chromium.connect_over_cdp(endpoint, timeout=30000)
+    log_local(f"已连接常驻浏览器（{time.monotonic() - started:.2f} 秒）")
+    return browser
+
+def stop_daemon(project_root):
+    """退出常驻浏览器"""
+    global _process
+    path = _endpoint_path(project_root)
+    pid = None
+    if os.path.exists(path):
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                pid = json.load(f).get("pid")
+        except (OSError, ValueError):
+            pass
+        os.remove(path)
+    if _process is not None and _process.poll() is None:
+        _process.terminate()
+        _process = None
+    elif pid:
+        try:
+            os.kill(pid, signal.SIGTERM)
+        except OSError:
+            pass
@@ -0,0 +1,127 @@
+import os
+import csv
+from datetime import datetime, timedelta
+from incremental import complete_through, merge_liushui, missing_ranges, record_merged
+from excel_rows import merge_files
+
+# 日期分段：长日期范围按月或按周拆成多个任务并发导出，完成后按顺序拼回流水
+
+DATE_FORMAT = "%Y-%m-%d"
+
+def split_range(kaishiriqi, jieshuriqi, unit="none"):
+    """把日期范围拆成 [(开始, 结束), ...]，unit 为 none/month/week（按自然月/自然周切分）"""
+    start = datetime.strptime(kaishiriqi, DATE_FORMAT)
+    end = datetime.strptime(jieshuriqi, DATE_FORMAT)
+    if unit == "none" or start > end:
+        return [(kaishiriqi, jieshuriqi)]
+    if unit not in ("month", "week"):
+        raise ValueError(f"不支持的日期分段方式: {unit}")
+    chunks = []
+    while start <= end:
+        if unit == "month":
+            next_start = (start.replace(day=1) + timedelta(days=32)).replace(day=1)
+        else:
+            next_start = start + timedelta(days=7 - start.weekday())
+        chunk_end = min(next_start - timedelta(days=1), end)
+        chunks.append((start.strftime(DATE_FORMAT), chunk_end.strftime(DATE_FORMAT)))
+        start = next_start
+    return chunks
+
+def plan_jobs(download_path, projects_accounts, kaishiriqi, jieshuriqi, options, manifest=None, log_local=None):
+    """生成导出任务 [(项目, 账号, 开始, 结束), ...] 以及需要拼接的分段 {(项目, 账号, 开始, 结束): 分段列表}"""
+    jobs = []
+    chunked = {}
+    for xiangmu, account in projects_accounts:
+        date_ranges = [(kaishiriqi, jieshuriqi)]
+        if options.get("incremental"):
+            date_ranges = missing_ranges(download_path, xiangmu, account, kaishiriqi, jieshuriqi)
+            if not date_ranges:
+                if log_local:
+                    log_local(f"流水已同步到 {jieshuriqi}，跳过（项目：{xiangmu}，账号：{account}）")
+                continue
+            if log_local:
+                text = "、".join(f"{start} 至 {end}" for start, end in date_ranges)
+                log_local(f"增量同步 {text}（项目：{xiangmu}，账号：{account}）")
+        for range_start, range_end in date_ranges:
+            chunks = split_range(range_start, range_end, options.get("chunk", "none"))
+            if options.get("incremental") and manifest is not None:
+                for start, end in chunks:
+                    # 在结束日期当天或之前导出的流水末几天可能尚未入账，需要重新导出；完整的文件直接复用，结束后合并
+                    entry = manifest.entries.get(manifest.key(xiangmu, account, "liushui", start, end))
+                    if (manifest.is_done(xiangmu, account, "liushui", start, end)
+                            and complete_through(datetime.strptime(end, DATE_FORMAT), entry.get("time") or entry["mtime"]) < datetime.strptime(end, DATE_FORMAT)):
+                        manifest.record_failure(xiangmu, account, "liushui", start, end, "导出时末日数据可能不完整，重新同步")
+            if len(chunks) > 1:
+                chunked[(xiangmu, account, range_start, range_end)] = chunks
+            # 同一账号的分段相邻排列，轮流分配给并发线程时会落在不同线程上同时下载
+            jobs.extend((xiangmu, account, start, end) for start, end in chunks)
+    return jobs, chunked
+
+def _exported_at(path, manifest, xiangmu, account, kaishiriqi, jieshuriqi):
+    """流水文件的导出时间：优先取清单登记时间（文件可能被硬链接到更早的同内容文件）"""
+    entry = manifest.entries.get(manifest.key(xiangmu, account, "liushui", kaishiriqi, jieshuriqi)) if manifest is not None else None
+    if entry and entry.get("status") == "done" and entry.get("time"):
+        return entry["time"]
+    return os.path.getmtime(path)
+
+def merge_into_cumulative(download_path, xiangmu, account, path, pieces, log_local, manifest=None):
+    """把流水文件追加到累计文件，成功后登记 pieces（[(开始, 结束), ...]）各自已完整同步的日期段"""
+    added = merge_liushui(download_path, xiangmu, path)
+    for start, end in pieces:
+        piece_path = os.path.join(download_path, xiangmu, "银行流水", f"{xiangmu}_银行流水_{start}_{end}.xlsx")
+        record_merged(download_path, xiangmu, account, start, end, _exported_at(piece_path, manifest, xiangmu, account, start, end))
+    log_local(f"累计流水新增 {added} 行（项目：{xiangmu}）")
+
+def assemble_chunks(download_path, xiangmu, account, kaishiriqi, jieshuriqi, chunks, log_local, manifest=None, incremental=False):
+    """按日期顺序拼接分段流水，并为分段回单生成索引，全部分段流水齐全时返回 True"""
+    liushui_dir = os.path.join(download_path, xiangmu, "银行流水")
+    huidan_dir = os.path.join(download_path, xiangmu, "银行回单")
+    parts = [os.path.join(liushui_dir, f"{xiangmu}_银行流水_{start}_{end}.xlsx") for start, end in chunks]
+    missing = [p for p in parts if not os.path.exists(p)]
+    if missing:
+        log_local(f"流水分段缺失 {len(missing)} 个，暂不拼接（项目：{xiangmu}，账号：{account}）")
+        return False
+    target = os.path.join(liushui_dir, f"{xiangmu}_银行流水_{kaishiriqi}_{jieshuriqi}.xlsx")
+    # 按行复制单元格原值，长账号不丢精度，并保留第一个分段的表头版式
+    rows = merge_files(parts, target)
+    log_local(f"已拼接 {len(parts)} 个流水分段：{os.path.basename(target)}（{rows} 行）")
+    if manifest is not None:
+        manifest.record(xiangmu, account, "liushui", kaishiriqi, jieshuriqi, target)
+    if incremental:
+        merge_into_cumulative(download_path, xiangmu, account, target, chunks, log_local, manifest)
+    index_path = os.path.join(huidan_dir, f"{xiangmu}_银行回单_{kaishiriqi}_{jieshuriqi}_索引.csv")
+    with open(index_path, "w", encoding="utf-8-sig", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["序号", "开始日期", "结束日期", "文件名", "状态"])
+        for i, (start, end) in enumerate(chunks, start=1):
+            filename = f"{xiangmu}_银行回单_{start}_{end}.pdf"
+            writer.writerow([i, start, end, filename, "已下载" if os.path.exists(os.path.join(huidan_dir, filename)) else "缺失"])
+    log_local(f"回单分段索引已生成：{os.path.basename(index_path)}")
+    return True
+
+def finalize_jobs(download_path, jobs, chunked, options, log_local, manifest=None):
+    """所有任务结束后拼接分段，增量模式下按日期顺序把新流水追加到累计文件
+
+    累计文件只登记实际合并成功的日期段，拼接或合并失败的部分下次运行会重新规划。
+    """
+    incremental = options.get("incremental")
+    chunk_jobs = set()
+    for (xiangmu, account, kaishiriqi, jieshuriqi), chunks in chunked.items():
+        chunk_jobs.update((xiangmu, account, start, end) for start, end in chunks)
+        try:
+            assemble_chunks(download_path, xiangmu, account, kaishiriqi, jieshuriqi, chunks, log_local, manifest, incremental)
+        except Exception as e:
+            log_local(f"拼接分段失败（项目：{xiangmu}，账号：{account}）：{str(e)}")
+    if not incremental:
+        return
+    for job in jobs:
+        if job in chunk_jobs:
+            continue
+        xiangmu, account, kaishiriqi, jieshuriqi = job
+        path = os.path.join(download_path, xiangmu, "银行流水", f"{xiangmu}_银行流水_{kaishiriqi}_{jieshuriqi}.xlsx")
+        if not os.path.exists(path):
+            continue
+        try:
+            merge_into_cumulative(download_path, xiangmu, account, path, [(kaishiriqi, jieshuriqi)], log_local, manifest)
+        except Exception as e:
+            log_local(f"追加累计流水失败（项目：{xiangmu}）：{str(e)}")
@@ -0,0 +1,120 @@
+import io
+import os
+import json
+import time
+import shutil
+import zipfile
+import threading
+import pyautogui
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+import spans
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+# 错误现场：失败分支只在内存中截图，压缩和写盘交给后台线程，页面线程立即继续；
+# 文件按运行分组存到 <下载目录>/errors/<运行编号>/，装有 Pillow 时转为 WebP，否则打包进 screenshots.zip，
+# 每个截图的账号、页面地址等写入同目录的 index.jsonl
+
+ERRORS_DIR = "errors"
+# errors 下最多保留的运行目录数，超出时删除最早的
+KEEP_RUNS = 20
+WEBP_QUALITY = 80
+
+class ErrorArtifacts:
+    """一次运行共用的错误截图写入器，多个工作线程可同时使用"""
+
+    def __init__(self, download_path, log_local, max_per_run=50, max_per_project=5):
+        self.log_local = log_local
+        self.max_per_run = max_per_run
+        self.max_per_project = max_per_project
+        run_id = spans.current_run_id() or f"{datetime.now().strftime('%Y%m%d_%H%M%S')}_{os.getpid()}"
+        root = os.path.join(download_path, ERRORS_DIR)
+        self.run_dir = os.path.join(root, run_id)
+        self._prune_runs(root)
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="error-artifacts")
+        self.lock = threading.Lock()
+        self.per_project = {}
+        self.kept = 0
+        self.dropped = 0
+        self.bytes_out = 0
+
+    def _prune_runs(self, root):
+        if not os.path.isdir(root):
+            return
+        runs = sorted(name for name in os.listdir(root) if os.path.isdir(os.path.join(root, name)))
+        for name in runs[:-KEEP_RUNS]:
+            shutil.rmtree(os.path.join(root, name), ignore_errors=True)
+
+    def _admit(self, xiangmu):
+        """未超过本次运行和该项目的上限时占用一个名额"""
+        with self.lock:
+            count = self.per_project.get(xiangmu, 0)
+            if self.kept >= self.max_per_run or count >= self.max_per_project:
+                self.dropped += 1
+                return False
+            self.kept += 1
+            self.per_project[xiangmu] = count + 1
+            return True
+
+    def capture_page(self, page, name, xiangmu):
+        """页面截图（PNG 字节）交给后台压缩写入"""
+        if not self._admit(xiangmu):
+            return
+        try:
+            data = page.screenshot()
+            url = page.url
+        except Exception as e:
+            self.log_local(f"错误截图失败：{name}_{xiangmu}（{str(e)}）")
+            return
+        self._submit(data, name, xiangmu, url)
+
+    def capture_screen(self, name, xiangmu):
+        """桌面截图（打印窗口等页面外的界面）交给后台压缩写入"""
+        if not self._admit(xiangmu):
+            return
+        self._submit(pyautogui.screenshot(), name, xiangmu, None)
+
+    def _submit(self, image, name, xiangmu, url):
+        entry = {
+            "time": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            "name": name,
+            "xiangmu": xiangmu,
+            # 账号标记只能在截图所在线程读取
+            "account": spans.current_account(),
+            "url": url,
+        }
+        self.executor.submit(self._write, image, f"{name}_{xiangmu}_{int(time.time() * 1000)}", entry)
+
+    def _write(self, image, stem, entry):
+        try:
+            os.makedirs(self.run_dir, exist_ok=True)
+            if Image is not None:
+                if isinstance(image, bytes):
+                    image = Image.open(io.BytesIO(image))
+                buffer = io.BytesIO()
+                image.convert("RGB").save(buffer, "WEBP", quality=WEBP_QUALITY)
+                data = buffer.getvalue()
+                entry["file"] = stem + ".webp"
+                with open(os.path.join(self.run_dir, entry["file"]), "wb") as f:
+                    f.write(data)
+            else:
+                data = image
+                entry["file"] = f"screenshots.zip/{stem}.png"
+                with zipfile.ZipFile(os.path.join(self.run_dir, "screenshots.zip"), "a", zipfile.ZIP_DEFLATED) as archive:
+                    archive.writestr(stem + ".png", data)
+            with open(os.path.join(self.run_dir, "index.jsonl"), "a", encoding="utf-8") as f:
+                f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+            self.bytes_out += len(data)
+        except Exception as e:
+            self.log_local(f"错误截图写入失败：{stem}（{str(e)}）")
+
+    def close(self):
+        """等待写完并输出统计"""
+        self.executor.shutdown()
+        if self.kept or self.dropped:
+            self.log_local(f"错误截图：保存 {self.kept} 张（{self.bytes_out / 1024:.0f} KB），"
+                           f"超出上限未保存 {self.dropped} 张，目录：{self.run_dir}")
@@ -0,0 +1,65 @@
+import os
+import pandas as pd
+from openpyxl import Workbook, load_workbook
+
+# 流水表格按行复制：用 openpyxl 读写单元格原值，以文本存储的长账号（19 位）不会经 pandas 转成数字丢失精度，
+# 合并或拆分时以第一个文件为底保留门户导出的标题、表头和列宽；旧版 .xls 无法用 openpyxl 打开时按文本读取
+
+# 表头占用的行数（与原来 read_excel(header=0) 的假设一致）
+HEADER_ROWS = 1
+
+def cell_text(value):
+    """单元格值的比较用文本：空值为空串，整数值的浮点数去掉 .0"""
+    if value is None or (isinstance(value, float) and value != value):
+        return ""
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return str(value).strip()
+
+def read_rows(path):
+    """返回工作表的所有非空行（单元格原值的元组）"""
+    try:
+        workbook = load_workbook(path, read_only=True)
+    except Exception:
+        frame = pd.read_excel(path, header=None, dtype=str)
+        rows = [tuple(None if pd.isna(v) else v for v in row) for row in frame.itertuples(index=False)]
+    else:
+        try:
+            rows = [tuple(row) for row in workbook.active.iter_rows(values_only=True)]
+        finally:
+            workbook.close()
+    return [row for row in rows if any(cell_text(v) for v in row)]
+
+def write_rows(target, rows, template=None, header_rows=HEADER_ROWS):
+    """写出 target：保留 template 的前 header_rows 行（含版式），其下替换为 rows；先写临时文件再替换"""
+    workbook = None
+    if template is not None:
+        try:
+            workbook = load_workbook(template)
+        except Exception:
+            workbook = None
+    if workbook is None:
+        workbook = Workbook()
+        sheet = workbook.active
+        for row in (read_rows(template)[:header_rows] if template is not None else []):
+            sheet.append(list(row))
+    else:
+        sheet = workbook.active
+        if sheet.max_row > header_rows:
+            sheet.delete_rows(header_rows + 1, sheet.max_row - header_rows)
+    for row in rows:
+        sheet.append(list(row))
+    tmp_path = target + ".tmp.xlsx"
+    workbook.save(tmp_path)
+    os.replace(tmp_path, target)
+
+def merge_files(parts, target, header_rows=HEADER_ROWS):
+    """按顺序合并 parts 的数据行到 target（表头取第一个文件），校验行数后返回合并的数据行数"""
+    rows = []
+    for path in parts:
+        rows.extend(read_rows(path)[header_rows:])
+    write_rows(target, rows, template=parts[0], header_rows=header_rows)
+    written = len(read_rows(target)) - header_rows
+    if written != len(rows):
+        raise IOError(f"合并后行数不一致（{written} / {len(rows)}）：{os.path.basename(target)}")
+    return len(rows)
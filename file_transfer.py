@@ -0,0 +1,64 @@
+import os
+import shutil
+import threading
+
+# 零拷贝落盘：浏览器下载目录放在导出目录所在的文件系统上，下载完成后用硬链接放到项目目录，
+# 只有跨设备或文件系统不支持硬链接时才复制
+DOWNLOADS_DIR = ".downloads"
+
+def downloads_dir(download_path):
+    """与导出目录同一文件系统的浏览器下载临时目录，作为 launch(downloads_path=...) 使用"""
+    path = os.path.join(download_path, DOWNLOADS_DIR)
+    os.makedirs(path, exist_ok=True)
+    return path
+
+class TransferStats:
+    """统计本次运行硬链接（未复制数据）与复制的字节数"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.linked = [0, 0]
+        self.copied = [0, 0]
+
+    def add(self, mode, size):
+        with self.lock:
+            counter = self.linked if mode == "linked" else self.copied
+            counter[0] += 1
+            counter[1] += size
+
+    def log_summary(self, log_local):
+        with self.lock:
+            linked, copied = list(self.linked), list(self.copied)
+        log_local(f"文件落盘：硬链接 {linked[0]} 个（{linked[1] / 1024 / 1024:.1f} MB 未复制），"
+                  f"复制 {copied[0]} 个（{copied[1] / 1024 / 1024:.1f} MB）")
+
+def place_file(src, dest, stats=None, verify=None):
+    """把下载临时文件 src 放到 dest，返回 "linked" 或 "copied"
+
+    先硬链接（失败时复制）到 dest.part，verify(临时路径) 校验通过后原子改名为 dest。
+    不直接改名 src：Playwright 之后还会访问并在上下文关闭时删除它，硬链接不受影响。
+    """
+    tmp_path = dest + ".part"
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+    try:
+        os.link(src, tmp_path)
+        mode = "linked"
+    except OSError:
+        # 跨设备（EXDEV）、网络共享或 FAT 等不支持硬链接的情况
+        shutil.copyfile(src, tmp_path)
+        mode = "copied"
+    try:
+        if verify:
+            verify(tmp_path)
+        os.replace(tmp_path, dest)
+        if os.path.exists(tmp_path):
+            # dest 已是同一文件的硬链接时 rename 不做任何事，临时链接需手动删除
+            os.remove(tmp_path)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    if stats is not None:
+        stats.add(mode, os.path.getsize(dest))
+    return mode
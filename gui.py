@@ -15,8 +15,10 @@ from flet import (
 )
 from openai import OpenAI
 
-from ningbo_bank import run_ningbo_bank
-from utils import log, read_bank_config, get_resource_path
+from ningbo_bank import run_ningbo_bank, login_with_cache, login_with_daemon
+from browser_daemon import connect_daemon, start_daemon, stop_daemon
+from ningbo_bank_async import run_ningbo_bank_async_main
+from utils import log, read_bank_config, read_run_options, get_resource_path
 
 class Task(ft.Column):
     def __init__(self, task_name, task_status_change, task_delete, completed=False):
@@ -319,6 +321,19 @@ def main(page: Page):
         label_style=ft.TextStyle(font_family="FZLanTingHei", size=14),
     )
 
+    workers_field = ft.TextField(
+        label="并发数",
+        value="",
+        width=page.window.width-70,
+        border_radius=8,
+        filled=True,
+        bgcolor=ft.Colors.WHITE,
+        hint_text="同时处理的浏览器/账号数量，留空使用 config.txt 中的设置",
+        keyboard_type=ft.KeyboardType.NUMBER,
+        text_style=ft.TextStyle(font_family="FZLanTingHei", size=14),
+        label_style=ft.TextStyle(font_family="FZLanTingHei", size=14),
+    )
+
     data_table = ft.DataTable(
         columns=[
             ft.DataColumn(ft.Text("项目名称", weight=ft.FontWeight.BOLD, size=14, font_family="FZLanTingHei")),
@@ -558,6 +573,14 @@ def main(page: Page):
         except ValueError:
             update_log("错误: 日期格式不正确，应为 YYYY-MM-DD")
             return
+        try:
+            # 留空时传 None，由 config.txt [run] 中的 workers / concurrency 决定
+            workers = int(workers_field.value.strip()) if workers_field.value.strip() else None
+            if workers is not None and workers < 1:
+                raise ValueError
+        except ValueError:
+            update_log("错误: 并发数必须为正整数")
+            return
         is_running[0] = True
         run_button.disabled = True
         run_button.text = "运行中..."
@@ -579,8 +602,11 @@ def main(page: Page):
                 if not os.path.exists(base_path) or not os.access(base_path, os.W_OK):
                     update_log(f"错误: 下载路径不可访问或不可写: {base_path}")
                     return
-                with sync_playwright() as playwright:
-                    run_ningbo_bank(playwright, project_root, base_path, excel_data, kaishi, jieshu, log_callback=update_log)
+                if read_run_options(project_root)["engine"] == "async":
+                    run_ningbo_bank_async_main(project_root, base_path, excel_data, kaishi, jieshu, log_callback=update_log, concurrency=workers)
+                else:
+                    with sync_playwright() as playwright:
+                        run_ningbo_bank(playwright, project_root, base_path, excel_data, kaishi, jieshu, log_callback=update_log, workers=workers)
                 update_log("导出完成。")
             except Exception as ex:
                 update_log(f"执行出错：{str(ex)}")
@@ -617,7 +643,7 @@ def main(page: Page):
     # 关闭按钮
     close_button = ft.IconButton(
         icon=ft.Icons.CLOSE,
-        on_click=lambda _: page.window.close(),
+        on_click=lambda _: close_window(),
         icon_size=15,
         style=ft.ButtonStyle(
             color=ft.Colors.RED_600,
@@ -625,6 +651,23 @@ def main(page: Page):
         ),
     )
 
+    # 关闭窗口时一并退出常驻浏览器
+    def close_window():
+        if read_run_options(project_root)["browser_daemon"]:
+            stop_daemon(project_root)
+        page.window.close()
+
+    # 启动时预热常驻浏览器，首次导出不必等待浏览器冷启动
+    def warm_daemon():
+        try:
+            with sync_playwright() as playwright:
+                start_daemon(playwright, project_root, update_log)
+        except Exception as ex:
+            update_log(f"常驻浏览器启动失败：{str(ex)}")
+
+    if read_run_options(project_root)["browser_daemon"]:
+        threading.Thread(target=warm_daemon, daemon=True).start()
+
     # 切换窗口大小函数（优化动画，减少抖动）
     def toggle_window_size():
         nonlocal is_maximized
@@ -656,8 +699,9 @@ def main(page: Page):
         run_button.width = page.window.width - 70
         select_path_button.width = page.window.width - 70
         import_excel_button.width = page.window.width - 70
+        workers_field.width = page.window.width - 70
         bank_export_content.controls[1].width = page.window.width - 70
-        bank_export_content.controls[5].width = page.window.width - 70
+        bank_export_content.controls[6].width = page.window.width - 70
         ai_content.controls[0].width = page.window.width - 70
         ai_content.controls[1].width = page.window.width - 70
         todo_content.controls[0].width = page.window.width - 70
@@ -719,18 +763,17 @@ def main(page: Page):
                         if not os.path.exists(browser_path):
                             log_local(f"Playwright 浏览器路径不存在: {browser_path}")
                             return
+                        if read_run_options(project_root)["browser_daemon"]:
+                            # 在常驻浏览器中登录，之后的导出直接复用该页面，断开连接不会关闭浏览器
+                            browser = connect_daemon(playwright, project_root, log_local)
+                            login_with_daemon(browser, project_root, username, password, login_url, log_local)
+                            log_local("宁波银行登录完成")
+                            browser.close()
+                            return
                         log_local("启动浏览器...")
                         browser = playwright.chromium.launch(headless=False, timeout=30000)
-                        context = browser.new_context(viewport=None)
-                        page = context.new_page()
-                        page.set_default_timeout(120000)
-                        log_local(f"访问登录页面: {login_url}")
-                        page.goto(login_url)
-                        log_local("输入用户名和密码...")
-                        page.get_by_role("textbox", name="用户名").fill(username)
-                        page.get_by_role("textbox", name="请输入您的密码").fill(password)
-                        log_local("等待账户管理页面加载...")
-                        # 停止在此处，符合需求
+                        context, page = login_with_cache(browser, project_root, username, password, login_url, log_local)
+                        log_local("宁波银行登录完成")
                         context.close()
                         browser.close()
                 except Exception as e:
@@ -768,6 +811,7 @@ def main(page: Page):
                 expand=True,
                 alignment=ft.MainAxisAlignment.SPACE_BETWEEN,
             ),
+            workers_field,
             select_path_button,
             base_path_text,
             import_excel_button,
@@ -0,0 +1,130 @@
+import os
+import json
+import threading
+from datetime import datetime, timedelta
+from excel_rows import HEADER_ROWS, cell_text, read_rows, write_rows
+
+# 增量同步：按已合并进累计文件的日期段确定每个账号缺哪些日期，只补缺失的日期
+
+DATE_FORMAT = "%Y-%m-%d"
+
+# 流水表中交易流水号列的常见列名关键字，用于识别已在累计文件中的交易
+SERIAL_COLUMN_HINTS = ("流水号", "交易编号", "交易序号", "交易号")
+
+_merge_lock = threading.Lock()
+
+def cumulative_path(download_path, xiangmu):
+    """项目的累计流水文件"""
+    return os.path.join(download_path, xiangmu, "银行流水", f"{xiangmu}_银行流水_累计.xlsx")
+
+def complete_through(end, exported_at):
+    """导出时当天及之后的交易可能尚未入账，文件只算同步到导出日期的前一天"""
+    exported_day = datetime.fromtimestamp(exported_at).replace(hour=0, minute=0, second=0, microsecond=0)
+    return min(end, exported_day - timedelta(days=1))
+
+def coverage_path(download_path, xiangmu):
+    """记录累计流水文件已合并的各账号日期段"""
+    return os.path.join(download_path, xiangmu, "银行流水", f"{xiangmu}_银行流水_累计_已合并.json")
+
+def _load_coverage(download_path, xiangmu):
+    """返回 {账号: [[开始, 结束], ...]}；累计文件不存在时视为没有合并过"""
+    path = coverage_path(download_path, xiangmu)
+    if not os.path.exists(cumulative_path(download_path, xiangmu)) or not os.path.exists(path):
+        return {}
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def _merge_ranges(ranges):
+    """合并重叠或相邻的日期段"""
+    merged = []
+    for start, end in sorted(ranges):
+        if merged and datetime.strptime(start, DATE_FORMAT) <= datetime.strptime(merged[-1][1], DATE_FORMAT) + timedelta(days=1):
+            merged[-1][1] = max(merged[-1][1], end)
+        else:
+            merged.append([start, end])
+    return merged
+
+def record_merged(download_path, xiangmu, account, kaishiriqi, jieshuriqi, exported_at):
+    """流水文件合并进累计文件后登记其覆盖的日期段（只算到导出日期的前一天）"""
+    end = complete_through(datetime.strptime(jieshuriqi, DATE_FORMAT), exported_at).strftime(DATE_FORMAT)
+    if end < kaishiriqi:
+        return
+    with _merge_lock:
+        coverage = _load_coverage(download_path, xiangmu)
+        coverage[account] = _merge_ranges(coverage.get(account, []) + [[kaishiriqi, end]])
+        path = coverage_path(download_path, xiangmu)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(coverage, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, path)
+
+def missing_ranges(download_path, xiangmu, account, kaishiriqi, jieshuriqi):
+    """返回 [开始, 结束] 内尚未合并进累计文件的日期段 [(开始, 结束), ...]
+
+    只以实际合并过的记录为准：中途失败的分段、未来得及合并就退出的导出都会留在缺口里，下次重新规划。
+    """
+    gaps = []
+    cursor = datetime.strptime(kaishiriqi, DATE_FORMAT)
+    last = datetime.strptime(jieshuriqi, DATE_FORMAT)
+    for start, end in _load_coverage(download_path, xiangmu).get(account, []):
+        start, end = datetime.strptime(start, DATE_FORMAT), datetime.strptime(end, DATE_FORMAT)
+        if end < cursor:
+            continue
+        if start > last:
+            break
+        if start > cursor:
+            gaps.append((cursor.strftime(DATE_FORMAT), (start - timedelta(days=1)).strftime(DATE_FORMAT)))
+        cursor = end + timedelta(days=1)
+    if cursor <= last:
+        gaps.append((cursor.strftime(DATE_FORMAT), jieshuriqi))
+    return gaps
+
+def find_serial_column(header):
+    """返回交易流水号列在表头中的位置，找不到返回 None"""
+    return next((i for i, name in enumerate(header) if any(h in cell_text(name) for h in SERIAL_COLUMN_HINTS)), None)
+
+def _row_keys(rows, positions):
+    """按列取值生成比较键，附带相同行的出现序号，使重复的真实交易逐条对应而不是合并为一条
+
+    单元格统一转成文本比较（空值为空串，50 与 50.0 相同），不受两个文件列类型不同的影响。
+    """
+    seen = {}
+    keys = []
+    for row in rows:
+        key = "\x1f".join(cell_text(row[i]) if i < len(row) else "" for i in positions)
+        seen[key] = seen.get(key, 0) + 1
+        keys.append(f"{key}\x1e{seen[key]}")
+    return keys
+
+def merge_liushui(download_path, xiangmu, new_file):
+    """把新下载的流水行追加到项目累计流水文件，只去掉累计文件中已有的交易，返回新增行数
+
+    有交易流水号列时按流水号判断；没有时按整行判断，同一天两笔完全相同的交易按出现次数逐条对应，不会被合并。
+    按行复制单元格原值，长账号不丢精度；新文件列顺序不同时按列名对齐到累计文件。
+    """
+    target = cumulative_path(download_path, xiangmu)
+    new_rows = read_rows(new_file)
+    new_header, new_data = list(new_rows[HEADER_ROWS - 1]) if new_rows else [], new_rows[HEADER_ROWS:]
+    with _merge_lock:
+        if not os.path.exists(target):
+            write_rows(target, new_data, template=new_file)
+            return len(new_data)
+        if not new_data:
+            return 0
+        existing = read_rows(target)
+        header, data = list(existing[HEADER_ROWS - 1]), existing[HEADER_ROWS:]
+        names = [cell_text(name) for name in header]
+        new_names = [cell_text(name) for name in new_header]
+        if new_names != names:
+            # 列顺序不同：按列名重排为累计文件的顺序
+            new_data = [tuple(row[new_names.index(name)] if name in new_names and new_names.index(name) < len(row) else None for name in names) for row in new_data]
+        serial = find_serial_column(header)
+        positions = [serial] if serial is not None else [i for i, name in enumerate(names) if name in new_names]
+        known = set(_row_keys(data, positions))
+        fresh = [row for row, key in zip(new_data, _row_keys(new_data, positions)) if key not in known]
+        if fresh:
+            write_rows(target, data + fresh, template=target)
+    return len(fresh)
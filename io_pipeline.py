@@ -0,0 +1,75 @@
+import os
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from api_export import EXPORT_KINDS
+from file_transfer import place_file
+
+# 流水线导出：页面线程拿到下载完成的临时文件后交给后台线程复制、校验、登记和改名，页面立即处理下一个账号
+
+class ExportWriter:
+    """后台文件写入器，每个页面/线程一个，页面所在上下文关闭前必须调用 drain()
+
+    Playwright 的下载临时文件在上下文关闭时删除，因此只能在上下文存活期间写完。
+    """
+
+    def __init__(self, log_local, manifest=None, max_workers=1, transfer=None):
+        self.log_local = log_local
+        self.manifest = manifest
+        self.transfer = transfer
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="export-writer")
+        self.futures = []
+        self.lock = threading.Lock()
+        self.files = 0
+        self.bytes = 0
+        self.failures = 0
+        self.busy = 0.0
+
+    def submit_file(self, src, dest, xiangmu, account, doc_type, kaishiriqi, jieshuriqi):
+        """提交一个下载完成的临时文件，后台链接或复制到 dest 并登记清单"""
+        self.futures.append(self.executor.submit(self._finalize, src, dest, xiangmu, account, doc_type, kaishiriqi, jieshuriqi))
+
+    def _finalize(self, src, dest, xiangmu, account, doc_type, kaishiriqi, jieshuriqi):
+        started = time.monotonic()
+
+        def verify(tmp_path):
+            size = os.path.getsize(tmp_path)
+            if size == 0 or size != os.path.getsize(src):
+                raise IOError(f"写入大小不一致（{size} / {os.path.getsize(src)} 字节）")
+            magic = EXPORT_KINDS.get(doc_type, (None, ()))[1]
+            if magic:
+                with open(tmp_path, "rb") as f:
+                    if not f.read(8).startswith(magic):
+                        raise IOError("文件头校验失败")
+
+        try:
+            place_file(src, dest, self.transfer, verify)
+            if self.manifest:
+                self.manifest.record(xiangmu, account, doc_type, kaishiriqi, jieshuriqi, dest)
+            with self.lock:
+                self.files += 1
+                self.bytes += os.path.getsize(dest)
+        except Exception as e:
+            self.log_local(f"后台写入失败：{os.path.basename(dest)}（{str(e)}）")
+            if self.manifest:
+                self.manifest.record_failure(xiangmu, account, doc_type, kaishiriqi, jieshuriqi, e)
+            with self.lock:
+                self.failures += 1
+        finally:
+            with self.lock:
+                self.busy += time.monotonic() - started
+
+    def drain(self):
+        """等待已提交的写入全部完成，返回页面线程因此等待的秒数"""
+        started = time.monotonic()
+        for future in self.futures:
+            future.result()
+        self.futures = []
+        return time.monotonic() - started
+
+    def close(self):
+        """等待写完并输出统计"""
+        waited = self.drain()
+        self.executor.shutdown()
+        self.log_local(f"后台写入：{self.files} 个文件，{self.bytes / 1024 / 1024:.1f} MB，失败 {self.failures} 个，"
+                       f"写入耗时 {self.busy:.1f} 秒，收尾等待 {waited:.1f} 秒")
@@ -5,7 +5,8 @@ import pandas as pd
 from playwright.sync_api import sync_playwright
 from datetime import datetime
 from ningbo_bank import run_ningbo_bank
-from utils import log, read_bank_config, get_resource_path
+from ningbo_bank_async import run_ningbo_bank_async_main
+from utils import log, read_bank_config, read_run_options, get_resource_path
 
 os.environ["PYTHONIOENCODING"] = "utf-8"
 
@@ -21,11 +22,17 @@ def main():
     os.environ["PLAYWRIGHT_BROWSERS_PATH"] = os.path.join(project_root, "playwright-browsers")
     log(f"设置 PLAYWRIGHT_BROWSERS_PATH: {os.environ['PLAYWRIGHT_BROWSERS_PATH']}", project_root)
 
-    if len(sys.argv) != 5:
-        log(f"参数错误: 需提供 download_path, excel_path, start_date, end_date", project_root)
+    if len(sys.argv) not in (5, 6, 7):
+        log(f"参数错误: 需提供 download_path, excel_path, start_date, end_date [workers] [print_mode]", project_root)
         sys.exit(1)
 
     download_path, excel_path, start_date, end_date = sys.argv[1:5]
+    try:
+        workers = int(sys.argv[5]) if len(sys.argv) >= 6 else None
+    except ValueError:
+        log(f"参数错误: 并发数必须为整数: {sys.argv[5]}", project_root)
+        sys.exit(1)
+    print_mode = sys.argv[6] if len(sys.argv) == 7 else None
 
     try:
         df = pd.read_excel(excel_path, header=0)
@@ -35,8 +42,12 @@ def main():
         excel_data = [(str(project).strip(), str(account).strip()) for project, account in zip(df.iloc[:, 0], df.iloc[:, 1]) if str(project).strip() and str(account).strip()]
         log(f"成功导入 Excel 文件：{excel_path}", download_path)
 
-        with sync_playwright() as playwright:
-            run_ningbo_bank(playwright, project_root, download_path, excel_data, start_date, end_date, log_callback=lambda msg: print(json.dumps({"log": msg})))
+        log_callback = lambda msg: print(json.dumps({"log": msg}))
+        if read_run_options(project_root)["engine"] == "async":
+            run_ningbo_bank_async_main(project_root, download_path, excel_data, start_date, end_date, log_callback=log_callback, concurrency=workers)
+        else:
+            with sync_playwright() as playwright:
+                run_ningbo_bank(playwright, project_root, download_path, excel_data, start_date, end_date, log_callback=log_callback, workers=workers, print_mode=print_mode)
         print(json.dumps({"status": "success"}))
     except Exception as e:
         print(json.dumps({"status": "error", "message": str(e)}))
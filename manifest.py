@@ -0,0 +1,109 @@
+import os
+import json
+import time
+import hashlib
+import threading
+
+# 断点续传清单：记录每个已完成文件，重跑时跳过校验通过的项目
+MANIFEST_FILE = "export_manifest.jsonl"
+
+DOC_TYPES = {
+    "huidan": "银行回单",
+    "liushui": "银行流水",
+    "duizhangdan": "对账单打印",
+}
+
+def file_sha256(path):
+    """计算文件 SHA-256"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+class ExportManifest:
+    """以 (项目, 账号, 文件类型, 开始日期, 结束日期) 为键的导出清单
+
+    清单为只追加的 JSONL 文件，进程中途退出最多丢失最后一行；同一个键以最后一条记录为准。
+    传入 blobs（BlobStore）时登记的文件会纳入内容寻址存储去重，清单同时作为 键 → 哈希 的索引。
+    """
+
+    def __init__(self, download_path, blobs=None):
+        log_dir = os.path.join(download_path, "导出日志")
+        os.makedirs(log_dir, exist_ok=True)
+        self.path = os.path.join(log_dir, MANIFEST_FILE)
+        self.entries = {}
+        self.lock = threading.Lock()
+        self.blobs = blobs
+        self._load()
+
+    @staticmethod
+    def key(xiangmu, account, doc_type, kaishiriqi, jieshuriqi):
+        return f"{xiangmu}|{account}|{doc_type}|{kaishiriqi}|{jieshuriqi}"
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue  # 进程中断时写了一半的行
+                self.entries[entry["key"]] = entry
+
+    def _append(self, entry):
+        with self.lock:
+            self.entries[entry["key"]] = entry
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+
+    def record(self, xiangmu, account, doc_type, kaishiriqi, jieshuriqi, path):
+        """登记一个已完成的文件，返回内容与上次登记相比是否有变化"""
+        key = self.key(xiangmu, account, doc_type, kaishiriqi, jieshuriqi)
+        sha256 = self.blobs.intern(path) if self.blobs else file_sha256(path)
+        previous = self.entries.get(key) or {}
+        changed = previous.get("sha256") != sha256
+        stat = os.stat(path)
+        self._append({
+            "key": key,
+            "status": "done",
+            "path": path,
+            "size": stat.st_size,
+            "mtime": stat.st_mtime,
+            "sha256": sha256,
+            "changed": changed,
+            "time": time.time(),
+        })
+        return changed
+
+    def record_failure(self, xiangmu, account, doc_type, kaishiriqi, jieshuriqi, error):
+        """登记失败项，下次运行会重试"""
+        self._append({
+            "key": self.key(xiangmu, account, doc_type, kaishiriqi, jieshuriqi),
+            "status": "failed",
+            "error": str(error),
+            "time": time.time(),
+        })
+
+    def is_done(self, xiangmu, account, doc_type, kaishiriqi, jieshuriqi):
+        """文件已登记且磁盘上的文件仍与登记一致"""
+        entry = self.entries.get(self.key(xiangmu, account, doc_type, kaishiriqi, jieshuriqi))
+        if not entry or entry.get("status") != "done":
+            return False
+        path = entry["path"]
+        if not os.path.exists(path):
+            return False
+        stat = os.stat(path)
+        if stat.st_size != entry["size"]:
+            return False
+        if stat.st_mtime == entry.get("mtime"):
+            return True
+        # 修改时间变化时重新计算哈希确认内容未变
+        return file_sha256(path) == entry["sha256"]
+
+    def pending(self, xiangmu, account, kaishiriqi, jieshuriqi, doc_types):
+        """返回仍需导出的文件类型集合"""
+        return {t for t in doc_types if not self.is_done(xiangmu, account, t, kaishiriqi, jieshuriqi)}
@@ -1,11 +1,863 @@
-from playwright.sync_api import Playwright
-from utils import log, read_bank_config, get_resource_path, find_and_click_image, handle_overwrite_dialog, handle_save_dialog
+from playwright.sync_api import Playwright, sync_playwright, TimeoutError as PlaywrightTimeoutError
+from utils import log, read_bank_config, read_run_options, get_resource_path, locate_image, click_image_center, handle_save_dialog
+from waits import Waiter, DownloadTracker
+from api_export import ApiCapture, LiveHeaders, api_export_account
+from manifest import ExportManifest, DOC_TYPES
+from blob_store import BlobStore
+from chunking import plan_jobs, finalize_jobs
+from session_cache import load_session, save_session, record_session_result, invalidate_session, session_age
+from route_filter import RouteFilter
+from browser_daemon import connect_daemon, read_endpoint
+from io_pipeline import ExportWriter
+from account_index import AccountIndex
+from batch_export import make_batches, split_liushui
+from session_guard import SessionGuard
+from trace_sampler import TraceSampler
+from spans import span, timed, start_run, finish_run, set_account
+from supervisor import BrowserCrashed, watch_crash, is_crashed, run_supervised
+from pagination import MAX_PAGES, next_page_button, widen_page_size, merge_slices, write_slice_index
+from file_transfer import downloads_dir, place_file, TransferStats
+from error_artifacts import ErrorArtifacts
+from page_recycler import PageRecycler
 import os
+import json
 import time
+import threading
 import pyautogui
 
-def run_ningbo_bank(playwright: Playwright, project_root, download_path, projects_accounts, kaishiriqi, jieshuriqi, log_callback=None):
-    """执行宁波银行流水、回单导出及对账单打印"""
+# 对账单打印依赖桌面截图与鼠标点击，多个线程同时操作会互相干扰，需串行执行
+PRINT_LOCK = threading.Lock()
+
+# 无头页面会话失效时弹出有界面浏览器登录，多个线程同时失效时只登录一次，其余线程复用刚保存的会话
+RELOGIN_LOCK = threading.Lock()
+
+def login_ningbo(page, username, password, login_url, log_local):
+    """打开登录页并等待进入账户管理页面"""
+    log_local(f"访问登录页面: {login_url}")
+    page.goto(login_url)
+    log_local("输入用户名和密码...")
+    page.get_by_role("textbox", name="用户名").fill(username)
+    page.get_by_role("textbox", name="请输入您的密码").fill(password)
+    log_local("等待账户管理页面加载...")
+    page.wait_for_selector('text=账户管理', timeout=90000)
+
+def is_logged_in(page, timeout=15000):
+    """判断当前页面是否处于已登录状态（出现账户管理而不是登录表单）"""
+    login_box = page.get_by_role("textbox", name="用户名")
+    try:
+        page.get_by_text("账户管理").first.or_(login_box).wait_for(state="visible", timeout=timeout)
+    except Exception:
+        return False
+    return not login_box.is_visible()
+
+def new_context(browser, options=None, storage_state=None):
+    """按运行参数创建浏览器上下文"""
+    options = options or {}
+    context = browser.new_context(viewport=None, storage_state=storage_state)
+    if options.get("print_mode") == "pdf":
+        # 直接渲染 PDF 时屏蔽页面自身的打印弹窗
+        context.add_init_script("window.print = () => {};")
+    return context
+
+def runs_headless(options):
+    """本次运行的页面是否在无头浏览器中（常驻浏览器为有界面模式，pdf 打印模式不使用常驻浏览器）"""
+    return options.get("print_mode") == "pdf" or (options.get("print_mode") != "desktop" and not options.get("browser_daemon"))
+
+@timed("登录")
+def login_with_cache(browser, project_root, username, password, login_url, log_local, options=None, form_login=True):
+    """优先复用缓存的登录会话，会话失效时才走登录表单，返回 (context, page)
+
+    登录表单需要人工提交，无头浏览器传 form_login=False：缓存会话缺失或失效时返回 (None, None)。
+    """
+    state_path, meta = load_session(project_root, username, login_url)
+    if state_path:
+        context = new_context(browser, options, storage_state=state_path)
+        page = context.new_page()
+        page.set_default_timeout(120000)
+        log_local("尝试复用已缓存的登录会话...")
+        page.goto(meta.get("home_url") or login_url)
+        if is_logged_in(page):
+            meta = record_session_result(project_root, username, login_url, hit=True)
+            age = session_age(meta)
+            age_text = f"{age / 60:.0f} 分钟" if age is not None else "未知"
+            log_local(f"登录会话缓存命中（会话已保存 {age_text}，累计命中 {meta.get('hits', 0)} 次，未命中 {meta.get('misses', 0)} 次）")
+            return context, page
+        log_local("缓存的登录会话已失效，重新登录...")
+        invalidate_session(project_root, username, login_url)
+        context.close()
+    if not form_login:
+        return None, None
+    meta = record_session_result(project_root, username, login_url, hit=False)
+    log_local(f"登录会话缓存未命中（累计命中 {meta.get('hits', 0)} 次，未命中 {meta.get('misses', 0)} 次）")
+    context = new_context(browser, options)
+    page = context.new_page()
+    page.set_default_timeout(120000)
+    login_ningbo(page, username, password, login_url, log_local)
+    save_session(project_root, username, login_url, context.storage_state(), page.url)
+    log_local("登录会话已缓存")
+    return context, page
+
+@timed("登录")
+def login_with_daemon(browser, project_root, username, password, login_url, log_local):
+    """在常驻浏览器的默认上下文中复用已登录的页面，未登录时先注入缓存会话再走登录表单，返回 (context, page)"""
+    context = browser.contexts[0] if browser.contexts else browser.new_context(viewport=None)
+    for page in context.pages:
+        if page.url.startswith("http") and is_logged_in(page, timeout=1000):
+            page.set_default_timeout(120000)
+            # 页面停留在上次运行结束时的状态（搜索框名称带着上次的项目），重新加载回到初始状态
+            page.reload()
+            page.wait_for_selector('text=账户管理', timeout=90000)
+            log_local("常驻浏览器已处于登录状态，直接复用")
+            return context, page
+    page = context.pages[0] if context.pages else context.new_page()
+    page.set_default_timeout(120000)
+    state_path, meta = load_session(project_root, username, login_url)
+    if state_path:
+        with open(state_path, "r", encoding="utf-8") as f:
+            context.add_cookies(json.load(f).get("cookies", []))
+        page.goto(meta.get("home_url") or login_url)
+        if is_logged_in(page):
+            record_session_result(project_root, username, login_url, hit=True)
+            log_local("已向常驻浏览器注入缓存的登录会话")
+            return context, page
+        invalidate_session(project_root, username, login_url)
+    record_session_result(project_root, username, login_url, hit=False)
+    login_ningbo(page, username, password, login_url, log_local)
+    save_session(project_root, username, login_url, context.storage_state(), page.url)
+    log_local("登录会话已缓存")
+    return context, page
+
+def fill_dates(page, kaishiriqi, jieshuriqi):
+    """填写查询的开始、结束日期"""
+    page.get_by_role("textbox", name="开始日期").fill(kaishiriqi)
+    page.get_by_role("textbox", name="开始日期").press("Enter")
+    page.get_by_role("textbox", name="结束日期").fill(jieshuriqi)
+    page.get_by_role("textbox", name="结束日期").press("Enter")
+
+def open_account_detail(page):
+    """进入账户管理 → 账户明细"""
+    page.get_by_role("link", name="账户管理").click()
+    page.get_by_role("link", name="账户明细").click()
+
+@timed("对账单打印")
+def print_statement(page, project_root, download_path, duizhangdan_path, xiangmu, kaishiriqi, jieshuriqi, log_local, waiter, artifacts):
+    """通过 Chrome 打印预览将对账单另存为 PDF，成功返回 True
+
+    每一步都轮询屏幕上的模板图像或窗口，出现即继续，不再固定等待。
+    """
+    page.get_by_role("button", name="打印 ").click()
+    log_local("点击打印按钮，等待对账单打印按钮...")
+    duizhangdan_button_path = get_resource_path("ningbo_duizhangdandayin.bmp", project_root)
+    if not os.path.exists(duizhangdan_button_path):
+        log_local(f"模板图像不存在: {duizhangdan_button_path}")
+        raise FileNotFoundError(f"模板图像不存在: {duizhangdan_button_path}")
+    target_printer_path = get_resource_path("target_printer.bmp", project_root)
+    save_as_pdf_default_path = get_resource_path("save_as_pdf_default.bmp", project_root)
+    save_as_pdf_hover_path = get_resource_path("save_as_pdf_hover.bmp", project_root)
+    save_button_path = get_resource_path("save_button.bmp", project_root)
+    if not (os.path.exists(target_printer_path) and os.path.exists(save_as_pdf_default_path) and
+            os.path.exists(save_as_pdf_hover_path) and os.path.exists(save_button_path)):
+        log_local(f"模板图像缺失或大小为0")
+        raise FileNotFoundError("请准备相关模板图像并放入 seek 文件夹")
+    log_local("定位‘对账单打印’按钮...")
+    try:
+        click_image_center(waiter.until("对账单打印按钮", lambda: locate_image(duizhangdan_button_path)))
+        log_local("成功点击‘对账单打印’按钮")
+    except TimeoutError:
+        log_local("未找到‘对账单打印’按钮")
+        artifacts.capture_screen("error_duizhangdan_button", xiangmu)
+        return False
+    log_local("等待 Chrome 打印窗口...")
+    log_local("定位‘目标打印机’位置...")
+    try:
+        x_target, y_target, _, _ = waiter.until("目标打印机", lambda: locate_image(target_printer_path))
+    except TimeoutError:
+        log_local("未找到‘目标打印机’文字")
+        artifacts.capture_screen("error_target_printer", xiangmu)
+        return False
+    x_offset = 250
+    pyautogui.click(x_target + x_offset, y_target)
+    log_local(f"模拟点击偏移位置: ({x_target + x_offset}, {y_target})")
+    pyautogui.moveTo(x_target + x_offset, y_target + 20)
+    # 下拉框展开后“另存为 PDF”可能处于默认或悬停状态
+    try:
+        pdf_pos = waiter.until("另存为PDF", lambda: locate_image(save_as_pdf_default_path) or locate_image(save_as_pdf_hover_path))
+    except TimeoutError:
+        log_local("未找到‘另存为 PDF’按钮")
+        artifacts.capture_screen("error_save_as_pdf", xiangmu)
+        return False
+    click_image_center(pdf_pos)
+    log_local("成功点击‘另存为 PDF’按钮")
+    try:
+        click_image_center(waiter.until("保存按钮", lambda: locate_image(save_button_path)))
+        log_local("成功点击‘保存’按钮")
+    except TimeoutError:
+        log_local("未找到‘保存’按钮")
+        artifacts.capture_screen("error_save_button", xiangmu)
+        return False
+    pdf_filename = f"{xiangmu}_对账单打印_{kaishiriqi}_{jieshuriqi}.pdf"
+    handle_save_dialog(duizhangdan_path, pdf_filename, download_path, waiter)
+    pdf_path = os.path.join(duizhangdan_path, pdf_filename)
+    if os.path.exists(pdf_path) and os.path.getsize(pdf_path) > 0:
+        log_local(f"对账单打印 PDF 完成：{pdf_path}")
+        return True
+    log_local(f"PDF 文件生成失败或为空：{pdf_path}")
+    return False
+
+@timed("对账单打印")
+def print_statement_pdf(page, duizhangdan_path, xiangmu, kaishiriqi, jieshuriqi, log_local, waiter):
+    """由浏览器直接把对账单打印视图渲染为 PDF（需无头模式），成功返回 True"""
+    page.get_by_role("button", name="打印 ").click()
+    log_local("点击打印按钮，等待对账单打印菜单...")
+    item = waiter.selector(page.get_by_text("对账单打印", exact=True).first, "对账单打印按钮")
+    try:
+        with page.context.expect_page(timeout=10000) as popup_info:
+            item.click()
+        target = popup_info.value
+        log_local("对账单打印视图已在新窗口打开")
+    except PlaywrightTimeoutError:
+        # 未弹出新窗口时打印视图渲染在当前页面
+        target = page
+    waiter.network_idle(target)
+    pdf_filename = f"{xiangmu}_对账单打印_{kaishiriqi}_{jieshuriqi}.pdf"
+    pdf_path = os.path.join(duizhangdan_path, pdf_filename)
+    try:
+        target.emulate_media(media="print")
+        # 旧文件可能是去重存储的硬链接，写临时文件后替换，不改动共享内容
+        target.pdf(path=pdf_path + ".part", format="A4", print_background=True)
+        os.replace(pdf_path + ".part", pdf_path)
+    finally:
+        if target is page:
+            page.emulate_media(media="screen")
+        else:
+            target.close()
+    if os.path.exists(pdf_path) and os.path.getsize(pdf_path) > 0:
+        log_local(f"对账单打印 PDF 完成：{pdf_path}")
+        return True
+    log_local(f"PDF 文件生成失败或为空：{pdf_path}")
+    return False
+
+def account_doc_types(options):
+    """本次运行每个账号需要产出的文件类型"""
+    doc_types = {"huidan", "liushui"}
+    if (options or {}).get("print_mode") != "none":
+        doc_types.add("duizhangdan")
+    return doc_types
+
+def save_download(download, dest, xiangmu, account, doc_type, kaishiriqi, jieshuriqi, state, manifest):
+    """保存下载文件：流水线模式交给后台写入器，否则直接硬链接/复制到位并登记清单"""
+    writer = state.get("writer")
+    if writer:
+        writer.submit_file(download.path(), dest, xiangmu, account, doc_type, kaishiriqi, jieshuriqi)
+        return
+    place_file(download.path(), dest, state.get("transfer"))
+    if manifest:
+        manifest.record(xiangmu, account, doc_type, kaishiriqi, jieshuriqi, dest)
+
+def save_screenshot(page, name, xiangmu, state):
+    """在内存中截取错误现场，由后台压缩写入 errors/<运行编号>/"""
+    state["artifacts"].capture_page(page, name, xiangmu)
+
+@timed("选择账号")
+def select_account(page, xiangmu, account, state, log_local, waiter):
+    """在账户树中选中账号，成功返回 True
+
+    state 中有账号定位索引时先按索引直接点击账号节点；未命中时在搜索框输入账号查询，
+    选中后抓取当前可见的账号节点刷新索引。
+    页面上第一个账号（含重新登录、回收页面后）必须走搜索：只有搜索后点击“展开”日期输入框才可见。
+    """
+    index = state.get("index")
+    if index is not None and state.get("previous_xiangmu") is not None and index.select(page, account):
+        log_local(f"按索引直接定位账号：{account}")
+        state["previous_xiangmu"] = xiangmu
+        return True
+    previous_xiangmu = state.get("previous_xiangmu")
+    if previous_xiangmu is None:
+        page.get_by_role("textbox", name="输入项目名称或项目对应账号关键字进行查询").click()
+        page.get_by_role("textbox", name="输入项目名称或项目对应账号关键字进行查询").fill(account)
+        log_local(f"使用银行账号查询：{account}")
+        try:
+            waiter.selector(page.get_by_role("listitem").filter(has_text=xiangmu).locator("span").nth(2), "搜索结果").click()
+        except Exception as e:
+            log_local(f"点击搜索结果失败（项目：{xiangmu}，账号：{account}）：{str(e)}")
+            save_screenshot(page, "error_select", xiangmu, state)
+            return False
+        page.get_by_text("展开").first.click()
+    else:
+        page.get_by_role("textbox", name="输入项目名称或项目对应账号关键字进行查询").click()
+        page.get_by_role("textbox", name=f"- {previous_xiangmu}").fill(account)
+        log_local(f"使用银行账号查询：{account}")
+        try:
+            waiter.selector(page.get_by_role("link", name=account), "搜索结果").click()
+        except Exception as e:
+            log_local(f"点击链接失败（项目：{xiangmu}，账号：{account}）：{str(e)}")
+            save_screenshot(page, "error_select", xiangmu, state)
+            return False
+    state["previous_xiangmu"] = xiangmu
+    if index is not None:
+        try:
+            index.crawl(page, xiangmu)
+        except Exception as e:
+            log_local(f"刷新账号定位索引失败：{str(e)}")
+    return True
+
+def download_kind(download):
+    """按建议文件名判断下载的是回单还是流水，无法判断时返回 None"""
+    name = download.suggested_filename.lower()
+    if name.endswith(".pdf"):
+        return "huidan"
+    if name.endswith((".xls", ".xlsx")):
+        return "liushui"
+    return None
+
+@timed("回单流水并行下载")
+def export_downloads_concurrently(page, xiangmu, account, kaishiriqi, jieshuriqi, targets, state, log_local, manifest):
+    """连续触发回单和流水导出，两个下载在浏览器中同时进行，再分别保存到 targets 中对应的路径，两者都成功时返回 True
+
+    一个账号的下载耗时取两者中较长的一个，而不是两者之和。
+    """
+    waiter = state["waiter"]
+    tracker = DownloadTracker(page, waiter)
+    triggered = []
+    saved = []
+    try:
+        page.get_by_role("button", name="导出 ").click()
+        item = page.locator("css=[id^='dropdown-menu-']:visible").filter(has_text="凭证导出").first
+        try:
+            waiter.selector(item, "导出菜单")
+            item.click()
+            triggered.append("huidan")
+        except PlaywrightTimeoutError:
+            log_local(f"未找到‘凭证导出’菜单项（项目：{xiangmu}）")
+            save_screenshot(page, "error_menu", xiangmu, state)
+            if manifest:
+                manifest.record_failure(xiangmu, account, "huidan", kaishiriqi, jieshuriqi, "未找到凭证导出菜单项")
+        try:
+            page.get_by_role("button", name="导出").click()
+            page.get_by_text("对账单导出", exact=True).click()
+            triggered.append("liushui")
+        except Exception as e:
+            log_local(f"触发银行流水导出失败：{str(e)}")
+            if manifest:
+                manifest.record_failure(xiangmu, account, "liushui", kaishiriqi, jieshuriqi, e)
+        for kind in triggered:
+            try:
+                download = tracker.take(lambda d, kind=kind: download_kind(d) in (kind, None))
+                save_download(download, targets[kind], xiangmu, account, kind, kaishiriqi, jieshuriqi, state, manifest)
+                saved.append(kind)
+                log_local(f"{DOC_TYPES[kind]}导出完成：{os.path.basename(targets[kind])}")
+            except Exception as e:
+                log_local(f"导出{DOC_TYPES[kind]}失败：{str(e)}")
+                if manifest:
+                    manifest.record_failure(xiangmu, account, kind, kaishiriqi, jieshuriqi, e)
+    finally:
+        tracker.close()
+    return len(saved) == len(targets)
+
+@timed("分页导出")
+def export_paged(page, download_path, xiangmu, account, kaishiriqi, jieshuriqi, needed, state, log_local, manifest):
+    """查询结果有多页时逐页全选导出：回单按页编号保存并生成分页索引，流水各页合并为一个文件"""
+    waiter = state["waiter"]
+    huidan_dir = os.path.join(download_path, xiangmu, "银行回单")
+    liushui_dir = os.path.join(download_path, xiangmu, "银行流水")
+    huidan_files, liushui_parts = [], []
+    for slice_no in range(1, MAX_PAGES + 1):
+        checkbox = waiter.selector(page.get_by_role("checkbox", name="Toggle Selection of All Rows"), "查询结果")
+        if not checkbox.is_checked():
+            checkbox.check()
+        if "huidan" in needed:
+            page.get_by_role("button", name="导出 ").click()
+            item = waiter.selector(page.locator("css=[id^='dropdown-menu-']:visible").filter(has_text="凭证导出").first, "导出菜单")
+            with waiter.download(page) as download_info:
+                item.click()
+            path = os.path.join(huidan_dir, f"{xiangmu}_银行回单_{kaishiriqi}_{jieshuriqi}_{slice_no:02d}.pdf")
+            place_file(download_info.value.path(), path, state.get("transfer"))
+            huidan_files.append(path)
+        if "liushui" in needed:
+            page.get_by_role("button", name="导出").click()
+            with waiter.download(page) as download_info:
+                page.get_by_text("对账单导出", exact=True).click()
+            path = os.path.join(liushui_dir, f"{xiangmu}_银行流水_{kaishiriqi}_{jieshuriqi}_{slice_no:02d}.xlsx")
+            place_file(download_info.value.path(), path, state.get("transfer"))
+            liushui_parts.append(path)
+        log_local(f"第 {slice_no} 页导出完成（项目：{xiangmu}，账号：{account}）")
+        button = next_page_button(page)
+        if button is None:
+            break
+        button.click()
+        waiter.network_idle(page)
+    else:
+        log_local(f"查询结果超过 {MAX_PAGES} 页，其余页未导出（项目：{xiangmu}，账号：{account}）")
+    if liushui_parts:
+        target = os.path.join(liushui_dir, f"{xiangmu}_银行流水_{kaishiriqi}_{jieshuriqi}.xlsx")
+        rows = merge_slices(liushui_parts, target)
+        log_local(f"已合并 {len(liushui_parts)} 页流水：{os.path.basename(target)}（{rows} 行）")
+        if manifest:
+            manifest.record(xiangmu, account, "liushui", kaishiriqi, jieshuriqi, target)
+    if huidan_files:
+        index_path = os.path.join(huidan_dir, f"{xiangmu}_银行回单_{kaishiriqi}_{jieshuriqi}_分页索引.csv")
+        write_slice_index(index_path, huidan_files)
+        log_local(f"银行回单按页导出 {len(huidan_files)} 个文件，索引：{os.path.basename(index_path)}")
+        if manifest:
+            # 回单为多个文件，清单登记分页索引
+            manifest.record(xiangmu, account, "huidan", kaishiriqi, jieshuriqi, index_path)
+
+def export_account(page, project_root, download_path, xiangmu, account, kaishiriqi, jieshuriqi, state, log_local, options=None, needed=None, manifest=None):
+    """处理单个账号：查询 → 回单导出 → 流水导出 → 对账单打印，成功返回 True
+
+    state 记录当前页面上一次选中的项目（previous_xiangmu，搜索框名称依赖它）、已填写的日期、页面的等待器、
+    流水线模式的后台写入器和账号定位索引。
+    needed 为仍需导出的文件类型（默认全部），已完成的步骤会跳过；完成的文件登记到 manifest。
+    """
+    options = options or {}
+    needed = account_doc_types(options) if needed is None else needed
+    waiter = state.setdefault("waiter", Waiter())
+    capture = options.get("export_mode") == "capture"
+    log_local(f"处理项目：{xiangmu}，银行账号：{account}")
+    duizhang_path = os.path.join(download_path, xiangmu, "银行流水")
+    huidan_path = os.path.join(download_path, xiangmu, "银行回单")
+    duizhangdan_path = os.path.join(download_path, xiangmu, "银行对账单")
+    os.makedirs(duizhang_path, exist_ok=True)
+    os.makedirs(huidan_path, exist_ok=True)
+    os.makedirs(duizhangdan_path, exist_ok=True)
+    if not select_account(page, xiangmu, account, state, log_local, waiter):
+        return False
+    if state.get("dates") != (kaishiriqi, jieshuriqi):
+        fill_dates(page, kaishiriqi, jieshuriqi)
+        state["dates"] = (kaishiriqi, jieshuriqi)
+    with span("查询"):
+        page.get_by_role("button", name=" 查询").click()
+        checkbox = waiter.selector(page.get_by_role("checkbox", name="Toggle Selection of All Rows"), "查询结果")
+    if not (checkbox.is_visible() and checkbox.is_enabled()):
+        log_local(f"无回单或流水数据，跳过导出（项目：{xiangmu}，账号：{account}）")
+        save_screenshot(page, "error_no_data", xiangmu, state)
+        return False
+    try:
+        if not checkbox.is_checked():
+            checkbox.check()
+        log_local("复选框已选中")
+    except Exception as e:
+        log_local(f"选中复选框失败（项目：{xiangmu}，账号：{account}）：{str(e)}")
+        save_screenshot(page, "error_checkbox", xiangmu, state)
+        return False
+    if options.get("paginate") and needed & {"huidan", "liushui"}:
+        if not state.get("page_size_checked"):
+            state["page_size_checked"] = True
+            try:
+                if widen_page_size(page, waiter, log_local):
+                    # 表格重新加载后全选状态会丢失
+                    checkbox = waiter.selector(page.get_by_role("checkbox", name="Toggle Selection of All Rows"), "查询结果")
+                    if not checkbox.is_checked():
+                        checkbox.check()
+            except Exception as e:
+                log_local(f"调整每页条数失败：{str(e)}")
+        if next_page_button(page) is not None:
+            log_local(f"查询结果有多页，逐页导出（项目：{xiangmu}，账号：{account}）")
+            export_paged(page, download_path, xiangmu, account, kaishiriqi, jieshuriqi, needed, state, log_local, manifest)
+            needed = needed - {"huidan", "liushui"}
+    downloads_ok = True
+    if options.get("parallel_downloads") and not capture and {"huidan", "liushui"} <= needed:
+        targets = {
+            "huidan": os.path.join(huidan_path, f"{xiangmu}_银行回单_{kaishiriqi}_{jieshuriqi}.pdf"),
+            "liushui": os.path.join(duizhang_path, f"{xiangmu}_银行流水_{kaishiriqi}_{jieshuriqi}.xlsx"),
+        }
+        downloads_ok = export_downloads_concurrently(page, xiangmu, account, kaishiriqi, jieshuriqi, targets, state, log_local, manifest)
+        needed = needed - {"huidan", "liushui"}
+    if "huidan" in needed:
+        # 导出回单
+        page.get_by_role("button", name="导出 ").click()
+        try:
+            item = page.locator("css=[id^='dropdown-menu-']:visible").filter(has_text="凭证导出").first
+            try:
+                waiter.selector(item, "导出菜单")
+                found = True
+            except PlaywrightTimeoutError:
+                found = False
+            if found:
+                with span("回单下载"):
+                    with ApiCapture(page, enabled=capture) as recorder, waiter.download(page) as download_info:
+                        item.click()
+                    download = download_info.value
+                    filename = f"{xiangmu}_银行回单_{kaishiriqi}_{jieshuriqi}.pdf"
+                    save_download(download, os.path.join(huidan_path, filename), xiangmu, account, "huidan", kaishiriqi, jieshuriqi, state, manifest)
+                log_local(f"银行回单导出完成：{filename}")
+                if capture:
+                    recorder.save(project_root, "huidan", download, account, kaishiriqi, jieshuriqi, log_local)
+            else:
+                log_local(f"未找到‘凭证导出’菜单项（项目：{xiangmu}）")
+                save_screenshot(page, "error_menu", xiangmu, state)
+                if manifest:
+                    manifest.record_failure(xiangmu, account, "huidan", kaishiriqi, jieshuriqi, "未找到凭证导出菜单项")
+        except Exception as e:
+            log_local(f"导出银行回单失败：{str(e)}")
+            if manifest:
+                manifest.record_failure(xiangmu, account, "huidan", kaishiriqi, jieshuriqi, e)
+    if "liushui" in needed:
+        # 导出流水
+        with span("流水下载"):
+            page.get_by_role("button", name="导出").click()
+            with ApiCapture(page, enabled=capture) as recorder, waiter.download(page) as download_info:
+                page.get_by_text("对账单导出", exact=True).click()
+            download = download_info.value
+            filename = f"{xiangmu}_银行流水_{kaishiriqi}_{jieshuriqi}.xlsx"
+            save_download(download, os.path.join(duizhang_path, filename), xiangmu, account, "liushui", kaishiriqi, jieshuriqi, state, manifest)
+        log_local(f"银行流水导出完成：{filename}")
+        if capture:
+            recorder.save(project_root, "liushui", download, account, kaishiriqi, jieshuriqi, log_local)
+    # 打印对账单为PDF
+    if "duizhangdan" not in needed:
+        return downloads_ok
+    try:
+        if options.get("print_mode") == "pdf":
+            ok = print_statement_pdf(page, duizhangdan_path, xiangmu, kaishiriqi, jieshuriqi, log_local, waiter)
+        else:
+            with PRINT_LOCK:
+                # 多线程时桌面上有多个浏览器窗口，打印按钮的截图定位和点击只对最前面的窗口有效
+                page.bring_to_front()
+                ok = print_statement(page, project_root, download_path, duizhangdan_path, xiangmu, kaishiriqi, jieshuriqi, log_local, waiter, state["artifacts"])
+    except Exception as e:
+        log_local(f"打印对账单 PDF 失败（项目：{xiangmu}）：{str(e)}")
+        save_screenshot(page, "error_print", xiangmu, state)
+        ok = False
+    if manifest:
+        if ok:
+            manifest.record(xiangmu, account, "duizhangdan", kaishiriqi, jieshuriqi, os.path.join(duizhangdan_path, f"{xiangmu}_对账单打印_{kaishiriqi}_{jieshuriqi}.pdf"))
+        else:
+            manifest.record_failure(xiangmu, account, "duizhangdan", kaishiriqi, jieshuriqi, "对账单打印失败")
+    return ok and downloads_ok
+
+@timed("批量导出流水")
+def export_batch(page, download_path, batch, state, log_local):
+    """多选一组账号后一次查询、一次对账单导出，再按账号列拆分流水，返回已写出的 (项目, 账号) 集合
+
+    账户树不支持多选时返回 None，state["batch_supported"] 置为 False，之后不再尝试。
+    """
+    waiter = state["waiter"]
+    xiangmu, account, kaishiriqi, jieshuriqi = batch[0]
+    if not select_account(page, xiangmu, account, state, log_local, waiter):
+        return None
+    checked = []
+    try:
+        for _, other, _, _ in batch:
+            box = page.locator("li", has=page.get_by_role("link", name=other, exact=True)).get_by_role("checkbox")
+            if box.count() != 1:
+                if other == account:
+                    log_local("账户树不支持多选账号，批量模式回退为逐个导出")
+                    state["batch_supported"] = False
+                else:
+                    log_local(f"账号 {other} 不在当前账户树中，本组回退为逐个导出")
+                return None
+            if not box.is_checked():
+                box.check()
+                checked.append(box)
+        log_local(f"已多选 {len(batch)} 个账号，批量导出流水")
+        fill_dates(page, kaishiriqi, jieshuriqi)
+        state["dates"] = (kaishiriqi, jieshuriqi)
+        page.get_by_role("button", name=" 查询").click()
+        checkbox = waiter.selector(page.get_by_role("checkbox", name="Toggle Selection of All Rows"), "查询结果")
+        if not checkbox.is_enabled():
+            log_local("本组账号无流水数据")
+            return None
+        if not checkbox.is_checked():
+            checkbox.check()
+        page.get_by_role("button", name="导出").click()
+        with waiter.download(page) as download_info:
+            page.get_by_text("对账单导出", exact=True).click()
+        download = download_info.value
+        combined_path = os.path.join(download_path, "导出日志", f"批量流水_{kaishiriqi}_{jieshuriqi}_{int(time.time())}.xlsx")
+        place_file(download.path(), combined_path, state.get("transfer"))
+    finally:
+        # 之后逐个导出回单、对账单时若仍多选，查询结果会混入其他账号
+        for box in checked:
+            try:
+                box.uncheck()
+            except Exception as e:
+                log_local(f"取消多选账号失败：{str(e)}")
+    try:
+        return split_liushui(combined_path, download_path, batch, log_local, state.get("manifest"))
+    finally:
+        os.remove(combined_path)
+
+def run_batches(page, download_path, jobs, state, log_local, batch_size, manifest):
+    """批量模式：先按组导出所有任务的流水，逐个处理账号时清单中已完成的流水会跳过"""
+    state["manifest"] = manifest
+    for batch in make_batches(jobs, batch_size):
+        batch = [job for job in batch if manifest.pending(*job, {"liushui"})]
+        if len(batch) < 2:
+            continue
+        if state.get("batch_supported") is False:
+            return
+        try:
+            written = export_batch(page, download_path, batch, state, log_local)
+            if written:
+                log_local(f"批量导出流水完成：{len(written)}/{len(batch)} 个账号")
+        except Exception as e:
+            log_local(f"批量导出流水失败，本组回退为逐个导出：{str(e)}")
+
+def adopt_session(page, project_root, username, password, login_url, log_local):
+    """无头页面无法手动完成登录：优先复用其他线程刚保存的会话，否则先用有界面浏览器登录，再把 cookie 加入当前上下文"""
+    home_url = page.url
+    with RELOGIN_LOCK:
+        state_path, meta = load_session(project_root, username, login_url)
+        if state_path:
+            with open(state_path, "r", encoding="utf-8") as f:
+                page.context.add_cookies(json.load(f).get("cookies", []))
+            page.goto(meta.get("home_url") or home_url)
+            if is_logged_in(page):
+                log_local("已复用缓存的登录会话")
+                return
+            invalidate_session(project_root, username, login_url)
+        log_local("无头浏览器无法手动登录，改用有界面浏览器登录...")
+        login_browser = page.context.browser.browser_type.launch(headless=False, timeout=30000)
+        try:
+            login_with_cache(login_browser, project_root, username, password, login_url, log_local)
+        finally:
+            login_browser.close()
+        state_path, meta = load_session(project_root, username, login_url)
+        if state_path is None:
+            raise RuntimeError("有界面登录后没有保存登录会话")
+        with open(state_path, "r", encoding="utf-8") as f:
+            page.context.add_cookies(json.load(f).get("cookies", []))
+    page.goto(meta.get("home_url") or home_url)
+    page.wait_for_selector('text=账户管理', timeout=90000)
+
+@timed("重新登录")
+def relogin_in_place(page, project_root, guard, state, log_local, headless=False):
+    """会话失效后用配置中的账号重新登录并恢复账户明细视图，成功返回 True
+
+    有界面页面直接在当前页面登录；无头页面通过 adopt_session 换上新的登录 cookie。
+    """
+    log_local("登录会话已失效，正在重新登录...")
+    started = time.monotonic()
+    try:
+        username, password, login_url, _ = read_bank_config(project_root)
+        if headless:
+            adopt_session(page, project_root, username, password, login_url, log_local)
+        else:
+            login_ningbo(page, username, password, login_url, log_local)
+            save_session(project_root, username, login_url, page.context.storage_state(), page.url)
+        open_account_detail(page)
+    except Exception as e:
+        guard.record(time.monotonic() - started, False)
+        log_local(f"重新登录失败：{str(e)}")
+        return False
+    # 重新进入账户明细后搜索框和日期都回到初始状态
+    state["previous_xiangmu"] = None
+    state.pop("dates", None)
+    guard.record(time.monotonic() - started, True)
+    log_local(f"重新登录完成，耗时 {time.monotonic() - started:.1f} 秒")
+    return True
+
+@timed("页面回收")
+def recycle_page(page, home_url, state, recycler, reason, log_local):
+    """在同一上下文中打开新页面并恢复账户明细视图，关闭旧页面，返回新页面；失败时继续使用旧页面"""
+    log_local(f"回收页面（{reason}）...")
+    started = time.monotonic()
+    if state.get("writer"):
+        # 旧页面的下载临时文件要先写完
+        state["writer"].drain()
+    new_page = page.context.new_page()
+    try:
+        new_page.set_default_timeout(120000)
+        new_page.goto(home_url)
+        new_page.wait_for_selector('text=账户管理', timeout=90000)
+        open_account_detail(new_page)
+    except Exception as e:
+        new_page.close()
+        recycler.record(reason, time.monotonic() - started, False)
+        recycler.attach(page)
+        log_local(f"页面回收失败，继续使用原页面：{str(e)}")
+        return page
+    page.close()
+    # 新页面上搜索框、日期和每页条数都回到初始状态
+    state["previous_xiangmu"] = None
+    state.pop("dates", None)
+    state.pop("page_size_checked", None)
+    recycler.attach(new_page)
+    recycler.record(reason, time.monotonic() - started, True)
+    log_local(f"页面回收完成，耗时 {time.monotonic() - started:.1f} 秒")
+    return new_page
+
+@timed("账号总耗时")
+def process_job(page, project_root, download_path, job, state, log_local, options, manifest, live_headers):
+    """处理一个任务 (项目, 账号, 开始日期, 结束日期)：跳过清单中已完成的文件，api 模式先走接口，其余走页面导出"""
+    xiangmu, account, kaishiriqi, jieshuriqi = job
+    needed = account_doc_types(options)
+    if manifest:
+        needed = manifest.pending(xiangmu, account, kaishiriqi, jieshuriqi, needed)
+        if not needed:
+            log_local(f"已完成，跳过（项目：{xiangmu}，账号：{account}）")
+            return True
+    if live_headers is not None and needed & {"huidan", "liushui"}:
+        if api_export_account(page.context, project_root, download_path, xiangmu, account, kaishiriqi, jieshuriqi, log_local, live_headers.headers):
+            if manifest:
+                manifest.record(xiangmu, account, "huidan", kaishiriqi, jieshuriqi, os.path.join(download_path, xiangmu, "银行回单", f"{xiangmu}_银行回单_{kaishiriqi}_{jieshuriqi}.pdf"))
+                manifest.record(xiangmu, account, "liushui", kaishiriqi, jieshuriqi, os.path.join(download_path, xiangmu, "银行流水", f"{xiangmu}_银行流水_{kaishiriqi}_{jieshuriqi}.xlsx"))
+            needed = needed - {"huidan", "liushui"}
+    if not needed:
+        return True
+    return export_account(page, project_root, download_path, xiangmu, account, kaishiriqi, jieshuriqi, state, log_local, options, needed, manifest)
+
+def run_accounts(page, project_root, download_path, jobs, log_local, options=None, manifest=None, transfer=None, artifacts=None):
+    """在同一页面上依次处理任务列表 [(项目, 账号, 开始日期, 结束日期), ...]，返回 (成功数, 失败数)
+
+    manifest 中已完成且校验通过的文件会跳过，全部完成的任务不再打开页面。
+    transfer 为本次运行共用的 TransferStats，统计下载文件硬链接与复制的字节数。
+    artifacts 为本次运行共用的 ErrorArtifacts，未传入时自行创建并在返回前写完。
+    batch_size > 1 时先按组批量导出流水，再逐个补齐回单和对账单。
+    session_guard 开启时发现登录会话失效会原地重新登录，并重试当前账号一次。
+    页面崩溃或浏览器断开时抛出 BrowserCrashed，携带从当前任务开始的剩余任务。
+    trace 开启时每个账号录制一段 trace，只保留失败或明显变慢的账号。
+    recycle_* 开启时页面内存超过阈值或满 N 个账号后换用新页面，恢复账户明细视图后继续。
+    """
+    options = options or {}
+    own_artifacts = artifacts is None
+    if own_artifacts:
+        artifacts = ErrorArtifacts(download_path, log_local, options.get("error_max_per_run", 50), options.get("error_max_per_project", 5))
+    state = {"previous_xiangmu": None, "waiter": Waiter(), "transfer": transfer, "artifacts": artifacts}
+    if options.get("pipeline"):
+        state["writer"] = ExportWriter(log_local, manifest, transfer=transfer)
+    if options.get("account_index"):
+        state["index"] = AccountIndex(project_root)
+    if options.get("batch_size", 1) > 1 and manifest:
+        run_batches(page, download_path, jobs, state, log_local, options["batch_size"], manifest)
+    live_headers = LiveHeaders(page) if options.get("export_mode") == "api" else None
+    guard = None
+    if options.get("session_guard"):
+        guard = SessionGuard(page, read_bank_config(project_root)[2])
+    watch_crash(page, state)
+    sampler = None
+    if options.get("trace"):
+        sampler = TraceSampler(page.context, download_path, log_local, options["trace_factor"])
+    recycler = PageRecycler.from_options(page, log_local, options)
+    home_url = page.url
+    succeeded, failed = 0, 0
+    try:
+        for index, job in enumerate(jobs):
+            set_account(f"{job[0]}/{job[1]}/{job[2]}~{job[3]}")
+            pending = not (manifest and not manifest.pending(*job, account_doc_types(options)))
+            # 清单中已完成的任务不录制，避免瞬间跳过的耗时拉低中位数
+            sampled = sampler is not None and pending
+            if sampled:
+                sampler.begin(job)
+            # 会话失效导致的失败在重新登录后重试一次
+            for attempt in (1, 2):
+                if is_crashed(page, state):
+                    raise BrowserCrashed(jobs[index:], succeeded, failed)
+                if guard and guard.check(page) and guard.can_relogin():
+                    relogin_in_place(page, project_root, guard, state, log_local, runs_headless(options))
+                try:
+                    ok = process_job(page, project_root, download_path, job, state, log_local, options, manifest, live_headers)
+                except Exception as e:
+                    log_local(f"导出失败（项目：{job[0]}）：{str(e)}")
+                    ok = False
+                if ok or is_crashed(page, state) or guard is None or attempt == 2 or not guard.check(page) or not guard.can_relogin():
+                    break
+                log_local(f"检测到登录会话失效，重新登录后重试（项目：{job[0]}，账号：{job[1]}）")
+            if not ok and is_crashed(page, state):
+                raise BrowserCrashed(jobs[index:], succeeded, failed)
+            if sampled:
+                sampler.end(job, ok)
+            if ok:
+                succeeded += 1
+            else:
+                failed += 1
+            # 跳过的任务不打开页面，不计入回收间隔
+            if recycler and pending and index < len(jobs) - 1 and not is_crashed(page, state):
+                reason = recycler.check()
+                if reason:
+                    page = recycle_page(page, home_url, state, recycler, reason, log_local)
+                    watch_crash(page, state)
+                    if guard:
+                        guard.watch(page)
+                    if live_headers:
+                        live_headers.watch(page)
+    finally:
+        if sampler:
+            sampler.close()
+        if recycler:
+            recycler.log_summary(log_local)
+        if own_artifacts:
+            artifacts.close()
+        if state.get("writer"):
+            # 下载临时文件随上下文关闭删除，返回前必须写完
+            state["writer"].close()
+        if state.get("index"):
+            state["index"].log_summary(log_local)
+        if guard:
+            guard.log_summary(log_local)
+        state["waiter"].log_summary(log_local)
+    return succeeded, failed
+
+def close_quietly(context, browser):
+    """关闭上下文和浏览器，忽略浏览器已崩溃时的错误；context 为 None 时只断开浏览器"""
+    for target in (context, browser):
+        if target is None:
+            continue
+        try:
+            target.close()
+        except Exception:
+            pass
+
+def run_worker(worker_id, storage_state, home_url, project_root, download_path, jobs, log_callback, results, options, manifest=None, route_filter=None, cdp_endpoint=None, transfer=None, artifacts=None):
+    """并发工作线程：复用主线程的登录状态，独立启动浏览器（或连接常驻浏览器 cdp_endpoint）处理分配到的任务"""
+    def log_local(msg):
+        log(f"[线程{worker_id}] {msg}", download_path, log_callback)
+    log_local(f"分配任务数：{len(jobs)}")
+    try:
+        # Playwright 同步接口不能跨线程共享，每个线程使用独立的 playwright 实例
+        with sync_playwright() as playwright:
+            session = {}
+
+            def start(restarts):
+                if session:
+                    close_quietly(session["context"], session["browser"])
+                if cdp_endpoint:
+                    browser = playwright.chromium.connect_over_cdp(cdp_endpoint, timeout=30000)
+                else:
+                    browser = playwright.chromium.launch(headless=options["print_mode"] != "desktop", timeout=30000, downloads_path=downloads_dir(download_path))
+                # 重启时主线程的登录状态可能已过期（其间可能有线程重新登录），优先使用缓存中最新的会话
+                state = storage_state
+                if restarts:
+                    username, _, login_url, _ = read_bank_config(project_root)
+                    state = load_session(project_root, username, login_url)[0] or storage_state
+                context = new_context(browser, options, storage_state=state)
+                session.update(browser=browser, context=context)
+                if route_filter:
+                    route_filter.install(context)
+                page = context.new_page()
+                page.set_default_timeout(120000)
+                page.goto(home_url)
+                page.wait_for_selector('text=账户管理', timeout=90000)
+                open_account_detail(page)
+                return page
+
+            try:
+                succeeded, failed, _ = run_supervised(
+                    jobs, start,
+                    lambda page, remaining: run_accounts(page, project_root, download_path, remaining, log_local, options, manifest, transfer, artifacts),
+                    log_local, options["max_restarts"])
+                results[worker_id] = (succeeded, failed)
+            finally:
+                if session:
+                    close_quietly(session["context"], session["browser"])
+    except Exception as e:
+        log_local(f"线程异常退出：{str(e)}")
+        # 已得出的统计不覆盖
+        results.setdefault(worker_id, (0, len(jobs)))
+
+def run_ningbo_bank(playwright: Playwright, project_root, download_path, projects_accounts, kaishiriqi, jieshuriqi, log_callback=None, workers=None, print_mode=None):
+    """执行宁波银行流水、回单导出及对账单打印
+
+    workers > 1 时只登录一次，然后把账号列表轮流分配给多个浏览器上下文并发处理。
+    完成的文件登记在 download_path/导出日志/export_manifest.jsonl，中断后重跑只补缺失或失败的文件。
+    print_mode 为 pdf 时浏览器以无头模式运行，对账单直接渲染为 PDF。
+    chunk 为 month/week 时长日期范围拆成多个分段任务并发导出，结束后按顺序拼接流水。
+    browser_daemon 开启时连接常驻浏览器（不存在则启动），复用其中已登录的页面，运行结束只断开连接。
+    block_resources 开启时登录完成后拦截图片、字体和统计请求，结束时输出拦截统计。
+    浏览器崩溃时重启并复用登录会话，从失败的账号继续，每个线程最多重启 max_restarts 次。
+    未传入的参数取自 config.txt 的 [run] 段。
+    """
     def log_local(msg):
         log(msg, download_path, log_callback)  # 日志保存到 download_path
     log_local("启动宁波银行导出流程...")
@@ -20,187 +872,112 @@ def run_ningbo_bank(playwright: Playwright, project_root, download_path, project
     if not os.path.exists(browser_path):
         log_local(f"Playwright 浏览器路径不存在: {browser_path}")
         raise FileNotFoundError(f"Playwright 浏览器路径不存在: {browser_path}")
+    options = read_run_options(project_root)
+    if workers is not None:
+        options["workers"] = workers
+    if print_mode is not None:
+        options["print_mode"] = print_mode
+    if options["print_mode"] not in ("desktop", "pdf", "none"):
+        raise ValueError(f"不支持的对账单打印模式: {options['print_mode']}")
+    if options["export_mode"] not in ("ui", "capture", "api"):
+        raise ValueError(f"不支持的导出模式: {options['export_mode']}")
+    manifest = ExportManifest(download_path, BlobStore(download_path) if options["dedup"] else None)
+    jobs, chunked = plan_jobs(download_path, projects_accounts, kaishiriqi, jieshuriqi, options, manifest, log_local)
+    if not jobs:
+        log_local("没有需要导出的任务")
+        return
+    workers = max(1, min(int(options["workers"] or 1), len(jobs)))
+    log_local(f"任务数: {len(jobs)}，并发数: {workers}，对账单打印模式: {options['print_mode']}，导出模式: {options['export_mode']}")
+    start_time = time.time()
+    run_id = start_run(download_path)
+    log_local(f"运行编号: {run_id}")
+    # 各线程共用，错误截图的数量上限按整次运行计算
+    artifacts = ErrorArtifacts(download_path, log_local, options["error_max_per_run"], options["error_max_per_project"])
     try:
-        log_local("启动浏览器...")
-        browser = playwright.chromium.launch(headless=False, timeout=30000)
-        context = browser.new_context(viewport=None)
-        page = context.new_page()
-        page.set_default_timeout(120000)
-        log_local(f"访问登录页面: {login_url}")
-        page.goto(login_url)
-        log_local("输入用户名和密码...")
-        page.get_by_role("textbox", name="用户名").fill(username)
-        page.get_by_role("textbox", name="请输入您的密码").fill(password)
-        log_local("等待账户管理页面加载...")
-        page.wait_for_selector('text=账户管理', timeout=90000)
-        page.get_by_role("link", name="账户管理").click()
-        page.get_by_role("link", name="账户明细").click()
-        previous_xiangmu = None
-        for index, (xiangmu, account) in enumerate(projects_accounts):
-            log_local(f"处理项目：{xiangmu}，银行账号：{account}")
-            try:
-                duizhang_path = os.path.join(download_path, xiangmu, "银行流水")
-                huidan_path = os.path.join(download_path, xiangmu, "银行回单")
-                duizhangdan_path = os.path.join(download_path, xiangmu, "银行对账单")
-                os.makedirs(duizhang_path, exist_ok=True)
-                os.makedirs(huidan_path, exist_ok=True)
-                os.makedirs(duizhangdan_path, exist_ok=True)
-                if index == 0:
-                    page.get_by_role("textbox", name="输入项目名称或项目对应账号关键字进行查询").click()
-                    page.get_by_role("textbox", name="输入项目名称或项目对应账号关键字进行查询").fill(account)
-                    log_local(f"使用银行账号查询：{account}")
-                    page.wait_for_timeout(1000)
-                    try:
-                        page.get_by_role("listitem").filter(has_text=xiangmu).locator("span").nth(2).click()
-                    except Exception as e:
-                        log_local(f"点击搜索结果失败（项目：{xiangmu}，账号：{account}）：{str(e)}")
-                        page.screenshot(path=os.path.join(download_path, f"error_select_{xiangmu}.png"))
-                        continue
-                    page.get_by_text("展开").first.click()
-                    page.get_by_role("textbox", name="开始日期").fill(kaishiriqi)
-                    page.get_by_role("textbox", name="开始日期").press("Enter")
-                    page.get_by_role("textbox", name="结束日期").fill(jieshuriqi)
-                    page.get_by_role("textbox", name="结束日期").press("Enter")
-                else:
-                    page.get_by_role("textbox", name="输入项目名称或项目对应账号关键字进行查询").click()
-                    page.get_by_role("textbox", name=f"- {previous_xiangmu}").fill(account)
-                    log_local(f"使用银行账号查询：{account}")
-                    page.wait_for_timeout(1000)
-                    try:
-                        page.get_by_role("link", name=account).click()
-                    except Exception as e:
-                        log_local(f"点击链接失败（项目：{xiangmu}，账号：{account}）：{str(e)}")
-                        page.screenshot(path=os.path.join(download_path, f"error_select_{xiangmu}.png"))
-                        continue
-                page.get_by_role("button", name=" 查询").click()
-                page.wait_for_selector('role=checkbox[name="Toggle Selection of All Rows"]', timeout=10000)
-                checkbox = page.get_by_role("checkbox", name="Toggle Selection of All Rows")
-                if not (checkbox.is_visible() and checkbox.is_enabled()):
-                    log_local(f"无回单或流水数据，跳过导出（项目：{xiangmu}，账号：{account}）")
-                    page.screenshot(path=os.path.join(download_path, f"error_no_data_{xiangmu}.png"))
-                    continue
-                try:
-                    if not checkbox.is_checked():
-                        checkbox.check()
-                    log_local("复选框已选中")
-                except Exception as e:
-                    log_local(f"选中复选框失败（项目：{xiangmu}，账号：{account}）：{str(e)}")
-                    page.screenshot(path=os.path.join(download_path, f"error_checkbox_{xiangmu}.png"))
-                    continue
-                # 导出回单
-                page.get_by_role("button", name="导出 ").click()
-                try:
-                    page.wait_for_timeout(1000)
-                    menus = page.locator("css=[id^='dropdown-menu-']")
-                    count = menus.count()
-                    found = False
-                    for i in range(count):
-                        item = menus.nth(i).filter(has_text="凭证导出")
-                        if item.is_visible():
-                            with page.expect_download() as download_info:
-                                item.click()
-                            download = download_info.value
-                            filename = f"{xiangmu}_银行回单_{kaishiriqi}_{jieshuriqi}.pdf"
-                            download.save_as(os.path.join(huidan_path, filename))
-                            log_local(f"银行回单导出完成：{filename}")
-                            found = True
-                            break
-                    if not found:
-                        log_local(f"未找到‘凭证导出’菜单项（项目：{xiangmu}）")
-                        page.screenshot(path=os.path.join(download_path, f"error_menu_{xiangmu}.png"))
-                except Exception as e:
-                    log_local(f"导出银行回单失败：{str(e)}")
-                # 导出流水
-                page.get_by_role("button", name="导出").click()
-                with page.expect_download() as download_info:
-                    page.get_by_text("对账单导出", exact=True).click()
-                download = download_info.value
-                filename = f"{xiangmu}_银行流水_{kaishiriqi}_{jieshuriqi}.xlsx"
-                download.save_as(os.path.join(duizhang_path, filename))
-                log_local(f"银行流水导出完成：{filename}")
-                # 打印对账单为PDF
+        headless = options["print_mode"] != "desktop"
+        # page.pdf 只能在无头浏览器中使用，常驻浏览器为有界面模式
+        use_daemon = options["browser_daemon"] and options["print_mode"] != "pdf"
+        route_filter = RouteFilter.from_options(options)
+        if options["block_resources"] and route_filter is None:
+            log_local("桌面打印模式下不拦截资源请求（打印轮询期间路由无法响应）")
+
+        def open_browser():
+            """启动（或连接常驻）浏览器并登录，返回 (browser, context, page)"""
+            if use_daemon:
+                browser = connect_daemon(playwright, project_root, log_local)
+                context, page = login_with_daemon(browser, project_root, username, password, login_url, log_local)
+            else:
+                # 下载目录与导出目录在同一文件系统，落盘时可以硬链接而不必复制
+                browser = playwright.chromium.launch(headless=headless, timeout=30000, downloads_path=downloads_dir(download_path))
                 try:
-                    page.get_by_role("button", name="打印 ").click()
-                    log_local("点击打印按钮，等待对账单打印按钮...")
-                    time.sleep(5)
-                    duizhangdan_button_path = get_resource_path("ningbo_duizhangdandayin.bmp", project_root)
-                    if not os.path.exists(duizhangdan_button_path):
-                        log_local(f"模板图像不存在: {duizhangdan_button_path}")
-                        raise FileNotFoundError(f"模板图像不存在: {duizhangdan_button_path}")
-                    log_local("定位‘对账单打印’按钮...")
-                    if find_and_click_image(duizhangdan_button_path, download_path, max_attempts=15):
-                        log_local("成功点击‘对账单打印’按钮")
-                    else:
-                        log_local("未找到‘对账单打印’按钮")
-                        pyautogui.screenshot(os.path.join(download_path, f"error_duizhangdan_button_{xiangmu}.png"))
-                        continue
-                    log_local("等待 Chrome 打印窗口...")
-                    time.sleep(5)
-                    target_printer_path = get_resource_path("target_printer.bmp", project_root)
-                    save_as_pdf_default_path = get_resource_path("save_as_pdf_default.bmp", project_root)
-                    save_as_pdf_hover_path = get_resource_path("save_as_pdf_hover.bmp", project_root)
-                    save_button_path = get_resource_path("save_button.bmp", project_root)
-                    if not (os.path.exists(target_printer_path) and os.path.exists(save_as_pdf_default_path) and
-                            os.path.exists(save_as_pdf_hover_path) and os.path.exists(save_button_path)):
-                        log_local(f"模板图像缺失或大小为0")
-                        raise FileNotFoundError("请准备相关模板图像并放入 seek 文件夹")
-                    log_local("定位‘目标打印机’位置...")
-                    target_pos = find_and_click_image(target_printer_path, download_path)
-                    if not target_pos:
-                        log_local("未找到‘目标打印机’文字")
-                        pyautogui.screenshot(os.path.join(download_path, f"error_target_printer_{xiangmu}.png"))
-                        continue
-                    x_target, y_target = target_pos
-                    x_offset = 250
-                    pyautogui.click(x_target + x_offset, y_target)
-                    log_local(f"模拟点击偏移位置: ({x_target + x_offset}, {y_target})")
-                    time.sleep(2)
-                    pdf_clicked = False
-                    for attempt in range(3):
-                        pyautogui.moveTo(x_target + x_offset, y_target + 20)
-                        time.sleep(0.5)
-                        if find_and_click_image(save_as_pdf_default_path, download_path):
-                            log_local("成功点击默认状态的‘另存为 PDF’按钮")
-                            pdf_clicked = True
-                            time.sleep(2)
-                            break
-                        elif find_and_click_image(save_as_pdf_hover_path, download_path):
-                            log_local("成功点击悬停状态的‘另存为 PDF’按钮")
-                            pdf_clicked = True
-                            time.sleep(2)
-                            break
-                    if not pdf_clicked:
-                        log_local("未找到‘另存为 PDF’按钮")
-                        pyautogui.screenshot(os.path.join(download_path, f"error_save_as_pdf_{xiangmu}.png"))
-                        continue
-                    if find_and_click_image(save_button_path, download_path):
-                        log_local("成功点击‘保存’按钮")
-                        time.sleep(2)
-                    else:
-                        log_local("未找到‘保存’按钮")
-                        pyautogui.screenshot(os.path.join(download_path, f"error_save_button_{xiangmu}.png"))
-                        continue
-                    pdf_filename = f"{xiangmu}_对账单打印_{kaishiriqi}_{jieshuriqi}.pdf"
-                    handle_save_dialog(duizhangdan_path, pdf_filename, download_path)
-                    pdf_path = os.path.join(duizhangdan_path, pdf_filename)
-                    if os.path.exists(pdf_path) and os.path.getsize(pdf_path) > 0:
-                        log_local(f"对账单打印 PDF 完成：{pdf_path}")
-                    else:
-                        log_local(f"PDF 文件生成失败或为空：{pdf_path}")
-                except Exception as e:
-                    log_local(f"打印对账单 PDF 失败（项目：{xiangmu}）：{str(e)}")
-                    page.screenshot(path=os.path.join(download_path, f"error_print_{xiangmu}.png"))
-                previous_xiangmu = xiangmu
-            except Exception as e:
-                log_local(f"导出失败（项目：{xiangmu}）：{str(e)}")
-                continue
-        context.close()
-        browser.close()
+                    context, page = login_with_cache(browser, project_root, username, password, login_url, log_local, options, form_login=not headless)
+                    if context is None:
+                        # 无头模式下无法手动完成登录，先用有界面浏览器登录并缓存会话
+                        log_local("无可用登录会话，先以有界面模式登录...")
+                        login_browser = playwright.chromium.launch(headless=False, timeout=30000)
+                        try:
+                            login_with_cache(login_browser, project_root, username, password, login_url, log_local, options)
+                        finally:
+                            login_browser.close()
+                        context, page = login_with_cache(browser, project_root, username, password, login_url, log_local, options, form_login=False)
+                        if context is None:
+                            raise RuntimeError("有界面登录后仍无法复用登录会话")
+                except Exception:
+                    browser.close()
+                    raise
+            # 登录页的验证码等图片需要正常加载，过滤只在登录完成后安装
+            if route_filter:
+                route_filter.install(context)
+            return browser, context, page
+
+        if not use_daemon:
+            log_local("启动浏览器...")
+        browser, context, page = open_browser()
+        transfer = TransferStats()
+        if workers == 1:
+            def start(restarts):
+                nonlocal browser, context, page
+                if restarts:
+                    # 常驻浏览器的默认上下文不能关闭，只断开连接
+                    close_quietly(None if use_daemon else context, browser)
+                    browser, context, page = open_browser()
+                open_account_detail(page)
+                return page
+
+            succeeded, failed, _ = run_supervised(
+                jobs, start,
+                lambda page, remaining: run_accounts(page, project_root, download_path, remaining, log_local, options, manifest, transfer, artifacts),
+                log_local, options["max_restarts"])
+        else:
+            storage_state = context.storage_state()
+            home_url = page.url
+            cdp_endpoint = read_endpoint(project_root) if use_daemon else None
+            log_local(f"登录完成，启动 {workers} 个并发线程...")
+            results = {}
+            threads = []
+            for worker_id in range(workers):
+                shard = jobs[worker_id::workers]
+                t = threading.Thread(target=run_worker, args=(worker_id + 1, storage_state, home_url, project_root, download_path, shard, log_callback, results, options, manifest, route_filter, cdp_endpoint, transfer, artifacts), daemon=True)
+                t.start()
+                threads.append(t)
+            for t in threads:
+                t.join()
+            succeeded = sum(r[0] for r in results.values())
+            failed = sum(r[1] for r in results.values())
+        with span("收尾合并"):
+            finalize_jobs(download_path, jobs, chunked, options, log_local, manifest)
+        if route_filter:
+            route_filter.log_summary(log_local)
+        transfer.log_summary(log_local)
+        if manifest.blobs:
+            manifest.blobs.log_summary(log_local)
+        log_local(f"导出结束：成功 {succeeded} 个，失败 {failed} 个，耗时 {time.time() - start_time:.1f} 秒")
     except Exception as e:
         log_local(f"初始化失败：{str(e)}")
         raise
     finally:
-        if 'context' in locals():
-            context.close()
+        # 常驻浏览器的默认上下文保留登录状态，只断开连接
         if 'browser' in locals():
-            browser.close()
\ No newline at end of file
+            close_quietly(None if use_daemon else context, browser)
+        artifacts.close()
+        finish_run(log_local)
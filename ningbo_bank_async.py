@@ -0,0 +1,287 @@
+import os
+import time
+import asyncio
+from playwright.async_api import async_playwright, TimeoutError as PlaywrightTimeoutError
+from utils import log, read_bank_config, read_run_options, RUN_OPTION_DEFAULTS
+from manifest import ExportManifest
+from blob_store import BlobStore
+from chunking import plan_jobs, finalize_jobs
+from session_cache import load_session, save_session, record_session_result, invalidate_session, session_age
+from route_filter import RouteFilter
+from file_transfer import downloads_dir, place_file, TransferStats
+from spans import span, start_run, finish_run, set_account
+
+# 异步引擎：单线程内用 asyncio 同时推进多个账号，信号量限制同时在跑的账号数
+
+# 只有同步引擎实现的 [run] 参数，异步引擎忽略（export_mode 单独判断，只支持 ui）
+SYNC_ONLY_OPTIONS = (
+    "workers", "pipeline", "account_index", "batch_size", "parallel_downloads", "paginate", "session_guard",
+    "max_restarts", "trace", "trace_factor", "error_max_per_run", "error_max_per_project",
+    "recycle_every", "recycle_heap_mb", "recycle_nodes", "browser_daemon",
+)
+
+def log_ignored_options(options, log_local):
+    """列出 config.txt 中设置了但异步引擎不支持的参数"""
+    ignored = [f"{key}={options[key]}" for key in SYNC_ONLY_OPTIONS if options[key] != RUN_OPTION_DEFAULTS[key]]
+    if options["export_mode"] != "ui":
+        ignored.insert(0, f"export_mode={options['export_mode']}（按 ui 导出）")
+    if ignored:
+        log_local(f"异步引擎不支持以下 [run] 参数，已忽略：{'，'.join(ignored)}")
+    log_local("异步引擎不保存错误截图，浏览器崩溃后不重启")
+
+async def is_logged_in(page, timeout=15000):
+    """判断当前页面是否处于已登录状态（出现账户管理而不是登录表单）"""
+    login_box = page.get_by_role("textbox", name="用户名")
+    try:
+        await page.get_by_text("账户管理").first.or_(login_box).wait_for(state="visible", timeout=timeout)
+    except Exception:
+        return False
+    return not await login_box.is_visible()
+
+async def login_ningbo(page, username, password, login_url, log_local):
+    """打开登录页并等待进入账户管理页面"""
+    log_local(f"访问登录页面: {login_url}")
+    await page.goto(login_url)
+    log_local("输入用户名和密码...")
+    await page.get_by_role("textbox", name="用户名").fill(username)
+    await page.get_by_role("textbox", name="请输入您的密码").fill(password)
+    log_local("等待账户管理页面加载...")
+    await page.wait_for_selector('text=账户管理', timeout=90000)
+
+async def new_context(browser, storage_state=None):
+    """创建屏蔽页面打印弹窗的浏览器上下文"""
+    context = await browser.new_context(viewport=None, storage_state=storage_state)
+    await context.add_init_script("window.print = () => {};")
+    return context
+
+async def login_with_cache(browser, project_root, username, password, login_url, log_local, form_login=True):
+    """优先复用缓存的登录会话，会话失效时才走登录表单，返回 (context, 登录后页面地址)
+
+    登录表单需要人工提交，无头浏览器传 form_login=False：缓存会话缺失或失效时返回 (None, None)。
+    """
+    state_path, meta = load_session(project_root, username, login_url)
+    if state_path:
+        context = await new_context(browser, storage_state=state_path)
+        page = await context.new_page()
+        log_local("尝试复用已缓存的登录会话...")
+        await page.goto(meta.get("home_url") or login_url)
+        if await is_logged_in(page):
+            meta = record_session_result(project_root, username, login_url, hit=True)
+            age = session_age(meta)
+            age_text = f"{age / 60:.0f} 分钟" if age is not None else "未知"
+            log_local(f"登录会话缓存命中（会话已保存 {age_text}，累计命中 {meta.get('hits', 0)} 次，未命中 {meta.get('misses', 0)} 次）")
+            home_url = page.url
+            await page.close()
+            return context, home_url
+        log_local("缓存的登录会话已失效，重新登录...")
+        invalidate_session(project_root, username, login_url)
+        await context.close()
+    if not form_login:
+        return None, None
+    meta = record_session_result(project_root, username, login_url, hit=False)
+    log_local(f"登录会话缓存未命中（累计命中 {meta.get('hits', 0)} 次，未命中 {meta.get('misses', 0)} 次）")
+    context = await new_context(browser)
+    page = await context.new_page()
+    await login_ningbo(page, username, password, login_url, log_local)
+    home_url = page.url
+    save_session(project_root, username, login_url, await context.storage_state(), home_url)
+    await page.close()
+    return context, home_url
+
+async def download_to(page, trigger, out_path, transfer=None):
+    """点击 trigger 并把触发的下载硬链接（跨设备时复制）到 out_path"""
+    async with page.expect_download() as download_info:
+        await trigger.click()
+    download = await download_info.value
+    place_file(await download.path(), out_path, transfer)
+
+async def print_statement_pdf(page, duizhangdan_path, xiangmu, kaishiriqi, jieshuriqi, log_local):
+    """由浏览器直接把对账单打印视图渲染为 PDF，成功返回 True"""
+    await page.get_by_role("button", name="打印 ").click()
+    item = page.get_by_text("对账单打印", exact=True).first
+    await item.wait_for(state="visible", timeout=15000)
+    try:
+        async with page.context.expect_page(timeout=10000) as popup_info:
+            await item.click()
+        target = await popup_info.value
+    except PlaywrightTimeoutError:
+        target = page
+    await target.wait_for_load_state("networkidle")
+    pdf_path = os.path.join(duizhangdan_path, f"{xiangmu}_对账单打印_{kaishiriqi}_{jieshuriqi}.pdf")
+    try:
+        await target.emulate_media(media="print")
+        # 旧文件可能是去重存储的硬链接，写临时文件后替换，不改动共享内容
+        await target.pdf(path=pdf_path + ".part", format="A4", print_background=True)
+        os.replace(pdf_path + ".part", pdf_path)
+    finally:
+        if target is page:
+            await page.emulate_media(media="screen")
+        else:
+            await target.close()
+    if os.path.exists(pdf_path) and os.path.getsize(pdf_path) > 0:
+        log_local(f"对账单打印 PDF 完成：{pdf_path}")
+        return True
+    log_local(f"PDF 文件生成失败或为空：{pdf_path}")
+    return False
+
+async def export_account(context, home_url, download_path, xiangmu, account, kaishiriqi, jieshuriqi, log_local, needed, manifest, transfer=None):
+    """在独立页面中导出单个账号仍缺失的文件类型，成功返回 True"""
+    duizhang_path = os.path.join(download_path, xiangmu, "银行流水")
+    huidan_path = os.path.join(download_path, xiangmu, "银行回单")
+    duizhangdan_path = os.path.join(download_path, xiangmu, "银行对账单")
+    for path in (duizhang_path, huidan_path, duizhangdan_path):
+        os.makedirs(path, exist_ok=True)
+    page = await context.new_page()
+    page.set_default_timeout(120000)
+    try:
+        await page.goto(home_url)
+        await page.wait_for_selector('text=账户管理', timeout=90000)
+        await page.get_by_role("link", name="账户管理").click()
+        await page.get_by_role("link", name="账户明细").click()
+        search_box = page.get_by_role("textbox", name="输入项目名称或项目对应账号关键字进行查询")
+        await search_box.click()
+        await search_box.fill(account)
+        log_local(f"使用银行账号查询：{account}")
+        result = page.get_by_role("listitem").filter(has_text=xiangmu).locator("span").nth(2)
+        await result.wait_for(state="visible", timeout=15000)
+        await result.click()
+        await page.get_by_text("展开").first.click()
+        for name, value in (("开始日期", kaishiriqi), ("结束日期", jieshuriqi)):
+            await page.get_by_role("textbox", name=name).fill(value)
+            await page.get_by_role("textbox", name=name).press("Enter")
+        await page.get_by_role("button", name=" 查询").click()
+        checkbox = page.get_by_role("checkbox", name="Toggle Selection of All Rows")
+        await checkbox.wait_for(state="visible", timeout=10000)
+        if not await checkbox.is_enabled():
+            log_local(f"无回单或流水数据，跳过导出（项目：{xiangmu}，账号：{account}）")
+            return False
+        if not await checkbox.is_checked():
+            await checkbox.check()
+        if "huidan" in needed:
+            # 导出回单
+            await page.get_by_role("button", name="导出 ").click()
+            voucher = page.locator("css=[id^='dropdown-menu-']:visible").filter(has_text="凭证导出").first
+            try:
+                await voucher.wait_for(state="visible", timeout=10000)
+                filename = f"{xiangmu}_银行回单_{kaishiriqi}_{jieshuriqi}.pdf"
+                await download_to(page, voucher, os.path.join(huidan_path, filename), transfer)
+                log_local(f"银行回单导出完成：{filename}")
+                manifest.record(xiangmu, account, "huidan", kaishiriqi, jieshuriqi, os.path.join(huidan_path, filename))
+            except Exception as e:
+                log_local(f"导出银行回单失败：{str(e)}")
+                manifest.record_failure(xiangmu, account, "huidan", kaishiriqi, jieshuriqi, e)
+        if "liushui" in needed:
+            # 导出流水
+            await page.get_by_role("button", name="导出").click()
+            filename = f"{xiangmu}_银行流水_{kaishiriqi}_{jieshuriqi}.xlsx"
+            await download_to(page, page.get_by_text("对账单导出", exact=True), os.path.join(duizhang_path, filename), transfer)
+            log_local(f"银行流水导出完成：{filename}")
+            manifest.record(xiangmu, account, "liushui", kaishiriqi, jieshuriqi, os.path.join(duizhang_path, filename))
+        if "duizhangdan" not in needed:
+            return True
+        ok = await print_statement_pdf(page, duizhangdan_path, xiangmu, kaishiriqi, jieshuriqi, log_local)
+        if ok:
+            manifest.record(xiangmu, account, "duizhangdan", kaishiriqi, jieshuriqi, os.path.join(duizhangdan_path, f"{xiangmu}_对账单打印_{kaishiriqi}_{jieshuriqi}.pdf"))
+        else:
+            manifest.record_failure(xiangmu, account, "duizhangdan", kaishiriqi, jieshuriqi, "对账单打印失败")
+        return ok
+    finally:
+        await page.close()
+
+async def run_job(semaphore, context, home_url, download_path, xiangmu, account, kaishiriqi, jieshuriqi, log_local, print_mode, manifest, transfer=None):
+    """在信号量限制下执行一个导出任务，返回结果字典"""
+    doc_types = {"huidan", "liushui"} if print_mode == "none" else {"huidan", "liushui", "duizhangdan"}
+    needed = manifest.pending(xiangmu, account, kaishiriqi, jieshuriqi, doc_types)
+    if not needed:
+        log_local(f"已完成，跳过（项目：{xiangmu}，账号：{account}）")
+        return {"xiangmu": xiangmu, "account": account, "range": f"{kaishiriqi}~{jieshuriqi}", "ok": True, "seconds": 0, "error": None}
+    async with semaphore:
+        log_local(f"处理项目：{xiangmu}，银行账号：{account}")
+        # gather 为每个任务复制上下文，账号标记互不影响
+        set_account(f"{xiangmu}/{account}/{kaishiriqi}~{jieshuriqi}")
+        started = time.time()
+        error = None
+        try:
+            with span("账号总耗时"):
+                ok = await export_account(context, home_url, download_path, xiangmu, account, kaishiriqi, jieshuriqi, log_local, needed, manifest, transfer)
+        except Exception as e:
+            ok = False
+            error = str(e)
+            log_local(f"导出失败（项目：{xiangmu}）：{error}")
+        return {"xiangmu": xiangmu, "account": account, "range": f"{kaishiriqi}~{jieshuriqi}", "ok": ok, "seconds": round(time.time() - started, 1), "error": error}
+
+async def run_ningbo_bank_async(playwright, project_root, download_path, projects_accounts, kaishiriqi, jieshuriqi, log_callback=None, concurrency=None):
+    """异步执行宁波银行导出，同时最多 concurrency 个账号在处理中，返回每个账号的结果列表"""
+    def log_local(msg):
+        log(msg, download_path, log_callback)
+    log_local("启动宁波银行导出流程（异步引擎）...")
+    username, password, login_url, config_path = read_bank_config(project_root)
+    log_local(f"加载配置文件: {config_path}")
+    options = read_run_options(project_root)
+    concurrency = max(1, int(concurrency or options["concurrency"]))
+    print_mode = options["print_mode"]
+    if print_mode == "desktop":
+        # 桌面图像识别打印无法并发，异步引擎改为浏览器直接渲染 PDF
+        log_local("异步引擎不支持桌面打印，对账单改用浏览器渲染 PDF")
+        print_mode = "pdf"
+    log_local(f"同时处理账号数: {concurrency}，对账单打印模式: {print_mode}")
+    log_ignored_options(options, log_local)
+    manifest = ExportManifest(download_path, BlobStore(download_path) if options["dedup"] else None)
+    jobs, chunked = plan_jobs(download_path, projects_accounts, kaishiriqi, jieshuriqi, options, manifest, log_local)
+    if not jobs:
+        log_local("没有需要导出的任务")
+        return []
+    started = time.time()
+    log_local(f"运行编号: {start_run(download_path)}")
+    # 浏览器启动、登录或收尾失败时也要写出本次运行的耗时汇总
+    try:
+        browser = await playwright.chromium.launch(headless=True, timeout=30000, downloads_path=downloads_dir(download_path))
+        transfer = TransferStats()
+        try:
+            with span("登录"):
+                context, home_url = await login_with_cache(browser, project_root, username, password, login_url, log_local, form_login=False)
+                if context is None:
+                    # 无头浏览器无法手动完成登录，缓存会话缺失或失效时先以有界面模式登录并缓存会话
+                    log_local("无可用登录会话，先以有界面模式登录...")
+                    login_browser = await playwright.chromium.launch(headless=False, timeout=30000)
+                    try:
+                        await login_with_cache(login_browser, project_root, username, password, login_url, log_local)
+                    finally:
+                        await login_browser.close()
+                    context, home_url = await login_with_cache(browser, project_root, username, password, login_url, log_local, form_login=False)
+                    if context is None:
+                        raise RuntimeError("有界面登录后仍无法复用登录会话")
+            # 异步引擎不走桌面打印，路由回调在事件循环中执行，不受打印轮询影响
+            route_filter = RouteFilter.from_options(dict(options, print_mode=print_mode))
+            if route_filter:
+                await route_filter.install_async(context)
+            semaphore = asyncio.Semaphore(concurrency)
+            results = await asyncio.gather(*[
+                run_job(semaphore, context, home_url, download_path, xiangmu, account, start, end, log_local, print_mode, manifest, transfer)
+                for xiangmu, account, start, end in jobs
+            ])
+            await context.close()
+        finally:
+            await browser.close()
+        with span("收尾合并"):
+            finalize_jobs(download_path, jobs, chunked, options, log_local, manifest)
+        if route_filter:
+            route_filter.log_summary(log_local)
+        transfer.log_summary(log_local)
+        if manifest.blobs:
+            manifest.blobs.log_summary(log_local)
+        succeeded = sum(1 for r in results if r["ok"])
+        log_local(f"导出结束：成功 {succeeded} 个，失败 {len(results) - succeeded} 个，耗时 {time.time() - started:.1f} 秒")
+        for r in results:
+            if not r["ok"]:
+                log_local(f"失败任务：{r['xiangmu']} / {r['account']} / {r['range']}（{r['error'] or '未完成全部步骤'}）")
+        return results
+    finally:
+        finish_run(log_local)
+
+def run_ningbo_bank_async_main(project_root, download_path, projects_accounts, kaishiriqi, jieshuriqi, log_callback=None, concurrency=None):
+    """供同步代码调用的入口，在当前线程内启动事件循环"""
+    async def runner():
+        async with async_playwright() as playwright:
+            return await run_ningbo_bank_async(playwright, project_root, download_path, projects_accounts, kaishiriqi, jieshuriqi, log_callback, concurrency)
+    return asyncio.run(runner())
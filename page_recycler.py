@@ -0,0 +1,82 @@
+# 页面回收：同一页面处理几百个账号后单页应用累积的 DOM 节点、JS 堆和查询缓存会拖慢后面的账号，
+# 每处理完一个账号通过 CDP Performance.getMetrics 读取页面的 JS 堆和节点数，超过阈值或满 N 个账号时
+# 在同一上下文中换一个新页面（登录状态保留），旧页面关闭后其渲染进程内存随之释放
+
+MB = 1024 * 1024
+
+class PageRecycler:
+    """判断当前页面是否需要回收，并统计每次回收前的内存指标"""
+
+    def __init__(self, page, log_local, every=0, heap_mb=0, max_nodes=0):
+        self.log_local = log_local
+        self.every = every
+        self.heap_limit = heap_mb * MB
+        self.max_nodes = max_nodes
+        self.metrics_failed = False
+        self.recycles = []
+        self.peak_heap = 0
+        self.peak_nodes = 0
+        self.attach(page)
+
+    @classmethod
+    def from_options(cls, page, log_local, options):
+        """按 [run] 中的 recycle_* 参数创建，均未开启时返回 None"""
+        if not (options.get("recycle_every") or options.get("recycle_heap_mb") or options.get("recycle_nodes")):
+            return None
+        return cls(page, log_local, options["recycle_every"], options["recycle_heap_mb"], options["recycle_nodes"])
+
+    def attach(self, page):
+        """开始跟踪一个新页面"""
+        self.accounts = 0
+        self.session = None
+        if not (self.heap_limit or self.max_nodes) or self.metrics_failed:
+            return
+        try:
+            self.session = page.context.new_cdp_session(page)
+            self.session.send("Performance.enable")
+        except Exception as e:
+            # 非 Chromium 浏览器没有 CDP，只按账号数回收
+            self.metrics_failed = True
+            self.session = None
+            self.log_local(f"无法读取页面内存指标（{str(e)}），页面回收只按账号数判断")
+
+    def metrics(self):
+        """返回 (JS 堆已用字节数, DOM 节点数)，无法读取时返回 None"""
+        if self.session is None:
+            return None
+        try:
+            values = {m["name"]: m["value"] for m in self.session.send("Performance.getMetrics")["metrics"]}
+        except Exception:
+            return None
+        heap, nodes = values.get("JSHeapUsedSize", 0), int(values.get("Nodes", 0))
+        self.peak_heap = max(self.peak_heap, heap)
+        self.peak_nodes = max(self.peak_nodes, nodes)
+        return heap, nodes
+
+    def check(self):
+        """处理完一个账号后调用，需要回收页面时返回原因，否则返回 None"""
+        self.accounts += 1
+        if self.every and self.accounts >= self.every:
+            return f"已处理 {self.accounts} 个账号"
+        current = self.metrics()
+        if current is None:
+            return None
+        heap, nodes = current
+        if self.heap_limit and heap >= self.heap_limit:
+            return f"JS 堆 {heap / MB:.0f} MB"
+        if self.max_nodes and nodes >= self.max_nodes:
+            return f"DOM 节点 {nodes} 个"
+        return None
+
+    def record(self, reason, seconds, ok):
+        """登记一次回收"""
+        self.recycles.append((reason, seconds, ok))
+
+    def log_summary(self, log_local):
+        if self.peak_heap:
+            log_local(f"页面内存峰值：JS 堆 {self.peak_heap / MB:.0f} MB，DOM 节点 {self.peak_nodes} 个")
+        if not self.recycles:
+            return
+        ok = sum(1 for _, _, success in self.recycles if success)
+        total = sum(seconds for _, seconds, _ in self.recycles)
+        log_local(f"页面回收：{len(self.recycles)} 次（成功 {ok} 次），总耗时 {total:.1f} 秒")
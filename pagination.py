@@ -0,0 +1,54 @@
+import os
+import re
+import csv
+from excel_rows import merge_files
+
+# 分页导出：查询结果超过一页时先尝试调大每页条数，仍有下一页则逐页导出，最后合并流水、为回单编号
+
+# 常见分页组件的“下一页”按钮与每页条数下拉框
+NEXT_PAGE_SELECTOR = "button.btn-next, li.ant-pagination-next, [aria-label='Next Page'], [aria-label='下一页'], [title='下一页']"
+PAGE_SIZE_SELECTOR = ".el-pagination__sizes, .ant-pagination-options-size-changer"
+PAGE_SIZE_TEXT = re.compile(r"^\s*(\d+)\s*条/页\s*$")
+MAX_PAGES = 500
+
+def next_page_button(page):
+    """返回可点击的“下一页”按钮，没有分页或已是最后一页时返回 None"""
+    button = page.locator(NEXT_PAGE_SELECTOR).first
+    if button.count() == 0 or not button.is_visible():
+        return None
+    if (not button.is_enabled() or button.get_attribute("aria-disabled") == "true"
+            or "disabled" in (button.get_attribute("class") or "")):
+        return None
+    return button
+
+def widen_page_size(page, waiter, log_local):
+    """把每页条数调到下拉框中的最大值，没有每页条数下拉框时返回 False"""
+    trigger = page.locator(PAGE_SIZE_SELECTOR).first
+    if trigger.count() == 0 or not trigger.is_visible():
+        return False
+    trigger.click()
+    choices = page.locator("li:visible").filter(has_text=PAGE_SIZE_TEXT)
+    sizes = [int(PAGE_SIZE_TEXT.match(text).group(1)) for text in choices.all_inner_texts() if PAGE_SIZE_TEXT.match(text)]
+    if not sizes:
+        page.keyboard.press("Escape")
+        return False
+    largest = max(sizes)
+    choices.filter(has_text=re.compile(rf"^\s*{largest}\s*条/页\s*$")).first.click()
+    waiter.network_idle(page)
+    log_local(f"每页条数已调整为 {largest}")
+    return True
+
+def merge_slices(parts, target):
+    """按页序合并流水分页文件，合并结果校验行数无误后才删除分页文件，返回总行数"""
+    rows = merge_files(parts, target)
+    for p in parts:
+        os.remove(p)
+    return rows
+
+def write_slice_index(index_path, files):
+    """写出回单分页索引（<项目>_银行回单_<开始>_<结束>_分页索引.csv）：序号、文件名"""
+    with open(index_path, "w", encoding="utf-8-sig", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["序号", "文件名"])
+        for i, path in enumerate(files, start=1):
+            writer.writerow([i, os.path.basename(path)])
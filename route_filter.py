@@ -0,0 +1,95 @@
+import re
+import threading
+
+# 请求过滤：自动导出时拦截图片、媒体、字体和第三方统计请求，下载接口始终放行
+# 注意：Playwright 启用路由后会关闭浏览器的 HTTP 缓存，因此只在登录完成后安装；
+# 同步接口的路由回调只在线程处于 Playwright 调用中时执行，桌面打印轮询屏幕期间页面的所有请求都会挂起，
+# 因此桌面打印模式下不启用
+
+DEFAULT_BLOCK_TYPES = ("image", "media", "font")
+
+# 常见第三方统计/埋点
+DEFAULT_BLOCK_PATTERNS = (
+    r"google-analytics\.com", r"googletagmanager\.com", r"doubleclick\.net",
+    r"hm\.baidu\.com", r"cnzz\.com", r"umeng\.com", r"growingio\.com",
+    r"sensorsdata", r"/collect\?", r"/track(ing)?\b",
+)
+
+# 命中任一规则的请求永远放行（下载、导出与接口请求）
+DEFAULT_ALLOW_PATTERNS = (
+    r"download", r"export", r"/api/", r"\.pdf(\?|$)", r"\.xlsx?(\?|$)",
+)
+
+# 被拦截请求无法得知真实大小，按资源类型估算节省的流量
+ESTIMATED_BYTES = {
+    "image": 30 * 1024,
+    "media": 500 * 1024,
+    "font": 80 * 1024,
+    "script": 40 * 1024,
+}
+DEFAULT_ESTIMATED_BYTES = 5 * 1024
+
+def _split(value):
+    return [item.strip() for item in (value or "").split(",") if item.strip()]
+
+class RouteFilter:
+    """按资源类型和 URL 规则拦截请求，统计拦截次数与估算节省的字节数"""
+
+    def __init__(self, block_types=DEFAULT_BLOCK_TYPES, block_patterns=DEFAULT_BLOCK_PATTERNS, allow_patterns=DEFAULT_ALLOW_PATTERNS):
+        self.block_types = set(block_types)
+        self.block_re = re.compile("|".join(block_patterns)) if block_patterns else None
+        self.allow_re = re.compile("|".join(allow_patterns), re.IGNORECASE) if allow_patterns else None
+        self.blocked = {}
+        self.allowed = 0
+        self.lock = threading.Lock()
+
+    @classmethod
+    def from_options(cls, options):
+        """根据 [run] 参数创建，未启用或为桌面打印模式时返回 None"""
+        if not options.get("block_resources") or options.get("print_mode") == "desktop":
+            return None
+        block_types = _split(options.get("block_types")) or DEFAULT_BLOCK_TYPES
+        allow_patterns = DEFAULT_ALLOW_PATTERNS + tuple(_split(options.get("block_allow")))
+        return cls(block_types, DEFAULT_BLOCK_PATTERNS, allow_patterns)
+
+    def should_block(self, request):
+        """判断请求是否拦截，并计入统计"""
+        url = request.url
+        if self.allow_re and self.allow_re.search(url):
+            block = False
+        else:
+            block = request.resource_type in self.block_types or bool(self.block_re and self.block_re.search(url))
+        with self.lock:
+            if block:
+                self.blocked[request.resource_type] = self.blocked.get(request.resource_type, 0) + 1
+            else:
+                self.allowed += 1
+        return block
+
+    def install(self, context):
+        """在同步接口的浏览器上下文上安装路由"""
+        def handler(route):
+            if self.should_block(route.request):
+                route.abort()
+            else:
+                route.continue_()
+        context.route("**/*", handler)
+
+    async def install_async(self, context):
+        """在异步接口的浏览器上下文上安装路由"""
+        async def handler(route):
+            if self.should_block(route.request):
+                await route.abort()
+            else:
+                await route.continue_()
+        await context.route("**/*", handler)
+
+    def log_summary(self, log_local):
+        """输出本次运行的拦截统计"""
+        with self.lock:
+            blocked = dict(self.blocked)
+            allowed = self.allowed
+        total = sum(blocked.values())
+        saved = sum(count * ESTIMATED_BYTES.get(kind, DEFAULT_ESTIMATED_BYTES) for kind, count in blocked.items())
+        detail = "，".join(f"{kind} {count}" for kind, count in sorted(blocked.items())) or "无"
+        log_local(f"请求过滤：拦截 {total} 个（{detail}），放行 {allowed} 个，估算节省 {saved / 1024 / 1024:.1f} MB")
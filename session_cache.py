@@ -0,0 +1,79 @@
+import os
+import json
+import time
+import hashlib
+import threading
+
+# 登录会话缓存：按账号+登录地址保存 Playwright storage_state，下次运行直接复用
+SESSION_DIR = "session_cache"
+
+_meta_lock = threading.Lock()
+
+def session_key(username, login_url):
+    """根据用户名和登录地址生成缓存键"""
+    return hashlib.sha256(f"{username}|{login_url}".encode("utf-8")).hexdigest()[:16]
+
+def _paths(project_root, username, login_url):
+    cache_dir = os.path.join(project_root, SESSION_DIR)
+    key = session_key(username, login_url)
+    return os.path.join(cache_dir, f"{key}_state.json"), os.path.join(cache_dir, f"{key}_meta.json")
+
+def _read_meta(meta_path):
+    if not os.path.exists(meta_path):
+        return {}
+    try:
+        with open(meta_path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def _write_meta(meta_path, meta):
+    os.makedirs(os.path.dirname(meta_path), exist_ok=True)
+    tmp_path = meta_path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(meta, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, meta_path)
+
+def load_session(project_root, username, login_url):
+    """返回 (storage_state 文件路径或 None, 元数据)"""
+    state_path, meta_path = _paths(project_root, username, login_url)
+    meta = _read_meta(meta_path)
+    if os.path.exists(state_path) and os.path.getsize(state_path) > 0:
+        return state_path, meta
+    return None, meta
+
+def save_session(project_root, username, login_url, storage_state, home_url):
+    """登录成功后保存 storage_state（context.storage_state() 的返回值）与进入系统后的页面地址"""
+    state_path, meta_path = _paths(project_root, username, login_url)
+    os.makedirs(os.path.dirname(state_path), exist_ok=True)
+    tmp_path = state_path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(storage_state, f)
+    os.replace(tmp_path, state_path)
+    with _meta_lock:
+        meta = _read_meta(meta_path)
+        meta.update({"username": username, "login_url": login_url, "home_url": home_url, "saved_at": time.time()})
+        _write_meta(meta_path, meta)
+    return state_path
+
+def record_session_result(project_root, username, login_url, hit):
+    """记录一次缓存命中/未命中，返回更新后的元数据"""
+    _, meta_path = _paths(project_root, username, login_url)
+    with _meta_lock:
+        meta = _read_meta(meta_path)
+        field = "hits" if hit else "misses"
+        meta[field] = meta.get(field, 0) + 1
+        meta["last_used"] = time.time()
+        _write_meta(meta_path, meta)
+    return meta
+
+def invalidate_session(project_root, username, login_url):
+    """删除已失效的 storage_state，保留统计数据"""
+    state_path, _ = _paths(project_root, username, login_url)
+    if os.path.exists(state_path):
+        os.remove(state_path)
+
+def session_age(meta):
+    """会话已保存的秒数，未保存过返回 None"""
+    saved_at = meta.get("saved_at")
+    return time.time() - saved_at if saved_at else None
@@ -0,0 +1,64 @@
+from urllib.parse import urlsplit
+
+# 会话健康检查：运行中门户会话超时后，接口返回 401 或页面被跳回登录页，发现后原地重新登录并重试当前账号
+
+# 连续重新登录失败达到该次数后不再尝试，避免每个账号都等待登录超时
+MAX_FAILED_RELOGINS = 3
+
+def _route(url):
+    """去掉查询串（含片段内的查询串）和末尾斜杠，保留哈希路由"""
+    base, _, fragment = url.partition("#")
+    route = base.split("?")[0].rstrip("/")
+    if fragment:
+        route += "#" + fragment.split("?")[0].rstrip("/")
+    return route
+
+class SessionGuard:
+    """监听页面响应判断会话是否失效，并统计重新登录次数与耗时"""
+
+    def __init__(self, page, login_url):
+        # 门户是哈希路由（如 https://www.e-custody.com/#/login），跳回登录页只改变片段，
+        # 响应地址不带片段也不产生导航请求，只能比较 page.url
+        self.login_route = _route(login_url)
+        self.host = urlsplit(login_url).hostname
+        self.expired = False
+        self.relogins = []
+        self.failed_in_row = 0
+        self.watch(page)
+
+    def watch(self, page):
+        """监听页面的响应（回收页面后对新页面再次调用）"""
+        page.on("response", self._on_response)
+
+    def _on_response(self, response):
+        request = response.request
+        if urlsplit(response.url).hostname != self.host:
+            return
+        if response.status == 401 and request.resource_type in ("xhr", "fetch", "document"):
+            self.expired = True
+
+    def check(self, page):
+        """会话是否已失效：收到过 401、当前地址是登录页（含片段），或当前页面显示登录表单"""
+        if self.expired or _route(page.url) == self.login_route:
+            return True
+        return page.get_by_role("textbox", name="用户名").is_visible()
+
+    def can_relogin(self):
+        return self.failed_in_row < MAX_FAILED_RELOGINS
+
+    def record(self, seconds, ok):
+        """登记一次重新登录的结果"""
+        self.relogins.append((seconds, ok))
+        if ok:
+            self.expired = False
+            self.failed_in_row = 0
+        else:
+            self.failed_in_row += 1
+
+    def log_summary(self, log_local):
+        if not self.relogins:
+            return
+        ok = [seconds for seconds, success in self.relogins if success]
+        total = sum(seconds for seconds, _ in self.relogins)
+        log_local(f"会话失效重新登录：{len(self.relogins)} 次（成功 {len(ok)} 次），总耗时 {total:.1f} 秒，"
+                  f"最长 {max(seconds for seconds, _ in self.relogins):.1f} 秒")
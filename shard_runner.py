@@ -0,0 +1,201 @@
+import os
+import sys
+import json
+import time
+import shutil
+import tempfile
+import threading
+import subprocess
+import pandas as pd
+from datetime import datetime
+from collections import deque
+from utils import log, read_bank_config, read_run_options
+from session_cache import load_session
+
+os.environ["PYTHONIOENCODING"] = "utf-8"
+
+# 多进程分片：把 Excel 账号列表切成若干分片，每个分片启动一个 main.py 进程（各自一个浏览器）
+
+def split_shards(excel_data, shard_count):
+    """按顺序均分账号列表"""
+    shard_count = max(1, min(shard_count, len(excel_data)))
+    size, extra = divmod(len(excel_data), shard_count)
+    shards, start = [], 0
+    for i in range(shard_count):
+        end = start + size + (1 if i < extra else 0)
+        shards.append(excel_data[start:end])
+        start = end
+    return shards
+
+def write_shard_excel(shard, path):
+    """把分片写成 main.py 能读取的两列 Excel"""
+    pd.DataFrame(shard, columns=["项目名称", "银行账号"]).to_excel(path, index=False)
+
+class ShardProcess:
+    """一个分片对应的 main.py 子进程，逐行转发其 JSON 输出"""
+
+    def __init__(self, shard_id, excel_path, account_count, args, emit):
+        self.shard_id = shard_id
+        self.excel_path = excel_path
+        self.account_count = account_count
+        self.args = args
+        self.emit = emit
+        self.attempts = 0
+        self.status = None
+        self.message = None
+        self.process = None
+        self.reader = None
+        # 非 JSON 输出（utils.log 的原样打印、异常堆栈），只保留最后几行用于说明崩溃原因
+        self.raw_tail = deque(maxlen=20)
+
+    def start(self):
+        self.attempts += 1
+        self.status = None
+        self.message = None
+        self.raw_tail.clear()
+        download_path, start_date, end_date, main_py, print_mode = self.args
+        self.process = subprocess.Popen(
+            [sys.executable, main_py, download_path, self.excel_path, start_date, end_date, "1", print_mode],
+            stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True, encoding="utf-8", errors="replace",
+        )
+        self.reader = threading.Thread(target=self._read_output, daemon=True)
+        self.reader.start()
+
+    def _read_output(self):
+        for line in self.process.stdout:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                message = json.loads(line)
+            except ValueError:
+                message = None
+            if not isinstance(message, dict):
+                # utils.log 已原样打印一遍，同一条日志随后还会以 JSON 输出，不再转发
+                self.raw_tail.append(line)
+                continue
+            if "status" in message:
+                self.status = message["status"]
+                self.message = message.get("message")
+            elif "log" in message:
+                self.emit({"log": f"[分片{self.shard_id}] {message['log']}"})
+
+    def poll(self):
+        """进程结束后返回是否成功，仍在运行返回 None"""
+        if self.process.poll() is None:
+            return None
+        self.reader.join()
+        if self.status is None and self.raw_tail:
+            self.message = self.raw_tail[-1]
+        return self.process.returncode == 0 and self.status == "success"
+
+def run_shards(project_root, download_path, excel_data, start_date, end_date, shard_count=None, max_retries=2, emit=None):
+    """并行运行所有分片，崩溃的分片重新调度，返回汇总报告"""
+    lock = threading.Lock()
+    def emit_line(message):
+        with lock:
+            print(json.dumps(message, ensure_ascii=False), flush=True)
+    emit = emit or emit_line
+    shard_count = shard_count or os.cpu_count() or 1
+    shards = split_shards(excel_data, shard_count)
+    print_mode = read_run_options(project_root)["print_mode"]
+    if print_mode == "desktop":
+        # 打印锁只在进程内有效，多个分片同时操作同一桌面会互相干扰
+        emit({"log": "多进程分片不支持桌面打印，对账单改用浏览器渲染 PDF"})
+        print_mode = "pdf"
+    work_dir = tempfile.mkdtemp(prefix="banksync_shards_")
+    try:
+        return _run_shards(project_root, download_path, excel_data, start_date, end_date, shards, work_dir, print_mode, max_retries, emit)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+def _session_confirmed(before, session):
+    """session 为 load_session 的返回值：会话文件存在，且之后有过一次缓存命中或重新保存"""
+    state_path, meta = session
+    return state_path is not None and (meta.get("hits", 0) > before.get("hits", 0) or meta.get("saved_at") != before.get("saved_at"))
+
+def _run_shards(project_root, download_path, excel_data, start_date, end_date, shards, work_dir, print_mode, max_retries, emit):
+    main_py = os.path.join(project_root, "main.py")
+    processes = []
+    for i, shard in enumerate(shards, start=1):
+        excel_path = os.path.join(work_dir, f"shard_{i}.xlsx")
+        write_shard_excel(shard, excel_path)
+        processes.append(ShardProcess(i, excel_path, len(shard), (download_path, start_date, end_date, main_py, print_mode), emit))
+    log(f"账号数 {len(excel_data)}，分片数 {len(processes)}", download_path)
+    emit({"log": f"账号数 {len(excel_data)}，分片数 {len(processes)}"})
+    started = time.time()
+    pending = list(processes)
+    username, _, login_url, _ = read_bank_config(project_root)
+    if len(pending) > 1:
+        # 缓存的会话文件存在不代表仍有效：先只启动一个分片，等它确认会话可用（缓存命中或重新登录并保存）
+        # 后再启动其余分片，避免每个分片都拿失效的会话各自登录
+        first = pending.pop(0)
+        before = load_session(project_root, username, login_url)[1]
+        first.start()
+        emit({"log": "等待第一个分片确认登录会话..."})
+        while first.poll() is None and not _session_confirmed(before, load_session(project_root, username, login_url)):
+            time.sleep(1)
+        running = [first]
+    else:
+        running = []
+    for shard in pending:
+        shard.start()
+        running.append(shard)
+    finished = []
+    while running:
+        time.sleep(0.5)
+        for shard in list(running):
+            ok = shard.poll()
+            if ok is None:
+                continue
+            running.remove(shard)
+            if ok:
+                finished.append(shard)
+                emit({"log": f"[分片{shard.shard_id}] 完成"})
+            elif shard.attempts <= max_retries:
+                emit({"log": f"[分片{shard.shard_id}] 异常退出（{shard.message or f'退出码 {shard.process.returncode}'}），第 {shard.attempts} 次重新调度"})
+                shard.start()
+                running.append(shard)
+            else:
+                finished.append(shard)
+                emit({"log": f"[分片{shard.shard_id}] 重试 {max_retries} 次后仍失败：{shard.message or f'退出码 {shard.process.returncode}'}"})
+    report = {
+        "status": "success" if all(s.status == "success" for s in processes) else "error",
+        "accounts": len(excel_data),
+        "seconds": round(time.time() - started, 1),
+        "shards": [
+            {"shard": s.shard_id, "accounts": s.account_count, "attempts": s.attempts, "status": s.status or "crashed", "message": s.message}
+            for s in processes
+        ],
+    }
+    report_dir = os.path.join(download_path, "导出日志")
+    os.makedirs(report_dir, exist_ok=True)
+    report_path = os.path.join(report_dir, f"分片报告_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json")
+    with open(report_path, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    emit({"log": f"分片报告已保存：{report_path}"})
+    return report
+
+def main():
+    project_root = os.path.abspath(os.path.dirname(__file__))
+    if len(sys.argv) not in (5, 6):
+        log(f"参数错误: 需提供 download_path, excel_path, start_date, end_date [shards]", project_root)
+        sys.exit(1)
+    download_path, excel_path, start_date, end_date = sys.argv[1:5]
+    try:
+        shard_count = int(sys.argv[5]) if len(sys.argv) == 6 else None
+        df = pd.read_excel(excel_path, header=0)
+        if df.empty or len(df.columns) < 2:
+            log("错误: Excel 文件格式错误，至少需要两列（项目名称和银行账号）", download_path)
+            sys.exit(1)
+        excel_data = [(str(project).strip(), str(account).strip()) for project, account in zip(df.iloc[:, 0], df.iloc[:, 1]) if str(project).strip() and str(account).strip()]
+        report = run_shards(project_root, download_path, excel_data, start_date, end_date, shard_count)
+        print(json.dumps({"status": report["status"], "report": report}, ensure_ascii=False))
+        if report["status"] != "success":
+            sys.exit(1)
+    except Exception as e:
+        print(json.dumps({"status": "error", "message": str(e)}))
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+import os
+import csv
+import json
+import math
+import time
+import threading
+import contextvars
+from contextlib import contextmanager
+from datetime import datetime
+from functools import wraps
+
+# 分步耗时记录：每次运行把登录、选择账号、查询、下载、打印等步骤以及各类等待的耗时逐条写入
+# 导出日志/spans_<运行编号>.jsonl，结束时输出每个步骤的 p50/p95/最大值并另存为 CSV
+
+_recorder = None
+_recorder_lock = threading.Lock()
+# 当前处理的账号，线程和 asyncio 任务各自独立
+_account = contextvars.ContextVar("span_account", default=None)
+
+def percentile(values, pct):
+    """最近秩法百分位数，values 需已排序"""
+    return values[max(0, math.ceil(pct / 100 * len(values)) - 1)]
+
+class SpanRecorder:
+    """一次运行的耗时记录"""
+
+    def __init__(self, download_path, run_id):
+        self.run_id = run_id
+        log_dir = os.path.join(download_path, "导出日志")
+        os.makedirs(log_dir, exist_ok=True)
+        self.path = os.path.join(log_dir, f"spans_{run_id}.jsonl")
+        self.file = open(self.path, "a", encoding="utf-8")
+        self.lock = threading.Lock()
+        self.durations = {}
+
+    def record(self, step, seconds, ok):
+        entry = {
+            "run": self.run_id,
+            "time": round(time.time(), 3),
+            "thread": threading.current_thread().name,
+            "account": _account.get(),
+            "step": step,
+            "seconds": round(seconds, 4),
+            "ok": ok,
+        }
+        with self.lock:
+            self.file.write(json.dumps(entry, ensure_ascii=False) + "\n")
+            self.durations.setdefault(step, []).append(seconds)
+
+    def summary(self):
+        """{步骤: (次数, p50, p95, 最大值)}"""
+        with self.lock:
+            result = {}
+            for step, values in self.durations.items():
+                values = sorted(values)
+                result[step] = (len(values), percentile(values, 50), percentile(values, 95), values[-1])
+            return result
+
+    def close(self, log_local):
+        summary = self.summary()
+        with self.lock:
+            self.file.close()
+        csv_path = self.path[:-len(".jsonl")] + "_summary.csv"
+        with open(csv_path, "w", encoding="utf-8-sig", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(["步骤", "次数", "p50秒", "p95秒", "最大秒"])
+            for step, (count, p50, p95, longest) in sorted(summary.items()):
+                writer.writerow([step, count, f"{p50:.3f}", f"{p95:.3f}", f"{longest:.3f}"])
+        for step, (count, p50, p95, longest) in sorted(summary.items(), key=lambda item: -item[1][0] * item[1][1]):
+            log_local(f"步骤耗时 {step}：{count} 次，p50 {p50:.2f} 秒，p95 {p95:.2f} 秒，最大 {longest:.2f} 秒")
+        log_local(f"分步耗时明细：{self.path}")
+
+def start_run(download_path):
+    """开始记录一次运行，返回运行编号"""
+    global _recorder
+    run_id = f"{datetime.now().strftime('%Y%m%d_%H%M%S')}_{os.getpid()}"
+    with _recorder_lock:
+        _recorder = SpanRecorder(download_path, run_id)
+    return run_id
+
+def finish_run(log_local):
+    """结束记录并输出各步骤的 p50/p95/最大值"""
+    global _recorder
+    with _recorder_lock:
+        recorder, _recorder = _recorder, None
+    if recorder is not None:
+        recorder.close(log_local)
+
+def current_run_id():
+    """当前运行编号，未在记录时返回 None"""
+    recorder = _recorder
+    return recorder.run_id if recorder else None
+
+def current_account():
+    """当前线程/任务正在处理的账号"""
+    return _account.get()
+
+def set_account(label):
+    """设置当前线程/任务正在处理的账号，之后的记录都带上它"""
+    _account.set(label)
+
+def record(step, seconds, ok=True):
+    """记录一条耗时，未在记录时忽略"""
+    recorder = _recorder
+    if recorder is not None:
+        recorder.record(step, seconds, ok)
+
+@contextmanager
+def span(step):
+    """记录一段代码的耗时"""
+    started = time.monotonic()
+    ok = False
+    try:
+        yield
+        ok = True
+    finally:
+        record(step, time.monotonic() - started, ok)
+
+def timed(step):
+    """函数装饰器：记录每次调用的耗时"""
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(step):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
@@ -0,0 +1,55 @@
+# 浏览器崩溃恢复：页面崩溃或浏览器断开时停止当前循环，重启浏览器（复用登录会话）后从失败的账号继续
+
+class BrowserCrashed(Exception):
+    """浏览器或页面崩溃，携带未完成的任务（含崩溃时正在处理的任务）和崩溃前的统计"""
+
+    def __init__(self, remaining, succeeded, failed, reason="页面崩溃或浏览器已断开"):
+        super().__init__(reason)
+        self.remaining = remaining
+        self.succeeded = succeeded
+        self.failed = failed
+
+def watch_crash(page, state):
+    """监听页面崩溃和浏览器断开，结果记在 state["crashed"]"""
+    state["crashed"] = False
+    page.on("crash", lambda _: state.__setitem__("crashed", True))
+    browser = page.context.browser
+    if browser is not None:
+        browser.on("disconnected", lambda _: state.__setitem__("crashed", True))
+
+def is_crashed(page, state):
+    return state.get("crashed") or page.is_closed()
+
+def run_supervised(jobs, start, run, log_local, max_restarts=2):
+    """执行任务，浏览器崩溃后重启并从失败的任务继续，返回 (成功数, 失败数, 重启次数)
+
+    start(restarts) 打开（restarts > 0 时先关闭崩溃的浏览器再重新打开）并返回可用的页面；
+    run(page, jobs) 返回 (成功数, 失败数)，崩溃时抛出 BrowserCrashed。
+    start 失败（如重启时浏览器无法启动或登录）时剩余任务记为失败，返回已完成部分的统计。
+    """
+    succeeded = failed = restarts = 0
+    remaining = jobs
+    while remaining:
+        try:
+            page = start(restarts)
+        except Exception as e:
+            log_local(f"浏览器{'重启' if restarts else '启动'}失败（{str(e)}），剩余 {len(remaining)} 个任务记为失败")
+            failed += len(remaining)
+            break
+        try:
+            done = run(page, remaining)
+            succeeded += done[0]
+            failed += done[1]
+            remaining = []
+        except BrowserCrashed as crash:
+            succeeded += crash.succeeded
+            failed += crash.failed
+            remaining = crash.remaining
+            if restarts >= max_restarts:
+                log_local(f"浏览器崩溃（{crash}），已重启 {restarts} 次达到上限，剩余 {len(remaining)} 个任务记为失败")
+                failed += len(remaining)
+                remaining = []
+            else:
+                restarts += 1
+                log_local(f"浏览器崩溃（{crash}），第 {restarts} 次重启后从 {remaining[0][0]} / {remaining[0][1]} 继续")
+    return succeeded, failed, restarts
@@ -0,0 +1,32 @@
+import os
+from openpyxl import Workbook, load_workbook
+from batch_export import split_liushui
+
+LONG_ACCOUNT = "6222000011112222333"
+OTHER_ACCOUNT = "6222000011112222444"
+
+def write_combined(path):
+    workbook = Workbook()
+    sheet = workbook.active
+    sheet.append(["交易日期", "账号", "对方账号", "金额"])
+    sheet.append(["2025-01-02", LONG_ACCOUNT, "6217001234567890123", 100.5])
+    sheet.append(["2025-01-03", OTHER_ACCOUNT, "6217001234567890999", 8])
+    sheet.append(["2025-01-04", LONG_ACCOUNT, "6217001234567890123", 100.5])
+    workbook.save(path)
+
+def test_split_keeps_19_digit_accounts(tmp_path):
+    combined = os.path.join(tmp_path, "combined.xlsx")
+    write_combined(combined)
+    batch = [("项目A", LONG_ACCOUNT, "2025-01-01", "2025-01-31"), ("项目B", "6222000099990000111", "2025-01-01", "2025-01-31")]
+    logs = []
+    written = split_liushui(combined, str(tmp_path), batch, logs.append)
+    # 合并导出中没有的账号不写文件，仍待逐个导出
+    assert written == {("项目A", LONG_ACCOUNT)}
+    assert not os.path.exists(os.path.join(tmp_path, "项目B"))
+    target = os.path.join(tmp_path, "项目A", "银行流水", "项目A_银行流水_2025-01-01_2025-01-31.xlsx")
+    rows = list(load_workbook(target).active.iter_rows(values_only=True))
+    assert rows[0] == ("交易日期", "账号", "对方账号", "金额")
+    assert rows[1:] == [
+        ("2025-01-02", LONG_ACCOUNT, "6217001234567890123", 100.5),
+        ("2025-01-04", LONG_ACCOUNT, "6217001234567890123", 100.5),
+    ]
@@ -0,0 +1,62 @@
+import os
+from openpyxl import Workbook, load_workbook
+from chunking import split_range, assemble_chunks, plan_jobs, finalize_jobs
+from manifest import ExportManifest
+
+def write_part(path, rows):
+    workbook = Workbook()
+    sheet = workbook.active
+    sheet.append(["交易日期", "对方账号", "金额"])
+    for row in rows:
+        sheet.append(row)
+    workbook.save(path)
+
+def test_split_range_by_month():
+    assert split_range("2025-01-15", "2025-03-02", "month") == [
+        ("2025-01-15", "2025-01-31"), ("2025-02-01", "2025-02-28"), ("2025-03-01", "2025-03-02"),
+    ]
+
+def test_assemble_chunks_keeps_long_accounts(tmp_path):
+    liushui_dir = os.path.join(tmp_path, "项目A", "银行流水")
+    os.makedirs(liushui_dir)
+    os.makedirs(os.path.join(tmp_path, "项目A", "银行回单"))
+    chunks = [("2025-01-01", "2025-01-31"), ("2025-02-01", "2025-02-28")]
+    write_part(os.path.join(liushui_dir, "项目A_银行流水_2025-01-01_2025-01-31.xlsx"), [["2025-01-05", "6217001234567890123", 12.5]])
+    write_part(os.path.join(liushui_dir, "项目A_银行流水_2025-02-01_2025-02-28.xlsx"), [["2025-02-05", "6217001234567890999", 7]])
+    assert assemble_chunks(str(tmp_path), "项目A", "1", "2025-01-01", "2025-02-28", chunks, lambda msg: None)
+    target = os.path.join(liushui_dir, "项目A_银行流水_2025-01-01_2025-02-28.xlsx")
+    rows = list(load_workbook(target).active.iter_rows(values_only=True))
+    assert rows == [
+        ("交易日期", "对方账号", "金额"),
+        ("2025-01-05", "6217001234567890123", 12.5),
+        ("2025-02-05", "6217001234567890999", 7),
+    ]
+
+def test_incremental_replans_failed_chunk_and_unmerged_exports(tmp_path):
+    download_path = str(tmp_path)
+    liushui_dir = os.path.join(download_path, "项目A", "银行流水")
+    os.makedirs(liushui_dir)
+    os.makedirs(os.path.join(download_path, "项目A", "银行回单"))
+    options = {"incremental": True, "chunk": "month"}
+    manifest = ExportManifest(download_path)
+    jobs, chunked = plan_jobs(download_path, [("项目A", "1")], "2025-01-01", "2025-03-31", options, manifest)
+    assert len(jobs) == 3
+    # 一月、三月导出成功，二月失败，随后合并
+    for start, end, day in [("2025-01-01", "2025-01-31", "2025-01-05"), ("2025-03-01", "2025-03-31", "2025-03-05")]:
+        path = os.path.join(liushui_dir, f"项目A_银行流水_{start}_{end}.xlsx")
+        write_part(path, [[day, "6217001234567890123", 1]])
+        manifest.record("项目A", "1", "liushui", start, end, path)
+    finalize_jobs(download_path, jobs, chunked, options, lambda msg: None, manifest)
+    # 分段不全没有合并任何日期：下次运行重新规划整个范围，已完成的分段由清单跳过，失败的二月重新导出
+    jobs, chunked = plan_jobs(download_path, [("项目A", "1")], "2025-01-01", "2025-03-31", options, manifest)
+    assert [job[2:] for job in jobs] == [("2025-01-01", "2025-01-31"), ("2025-02-01", "2025-02-28"), ("2025-03-01", "2025-03-31")]
+    assert manifest.pending("项目A", "1", "2025-01-01", "2025-01-31", ["liushui"]) == set()
+    path = os.path.join(liushui_dir, "项目A_银行流水_2025-02-01_2025-02-28.xlsx")
+    write_part(path, [["2025-02-05", "6217001234567890999", 2]])
+    manifest.record("项目A", "1", "liushui", "2025-02-01", "2025-02-28", path)
+    finalize_jobs(download_path, jobs, chunked, options, lambda msg: None, manifest)
+    jobs, chunked = plan_jobs(download_path, [("项目A", "1")], "2025-01-01", "2025-03-31", options, manifest)
+    assert jobs == [] and chunked == {}
+    # 后来加入的日期只规划缺口
+    jobs, chunked = plan_jobs(download_path, [("项目A", "1")], "2024-12-01", "2025-04-10", options, manifest)
+    assert [job[2:] for job in jobs] == [("2024-12-01", "2024-12-31"), ("2025-04-01", "2025-04-10")]
@@ -0,0 +1,47 @@
+import os
+import pandas as pd
+from openpyxl import Workbook, load_workbook
+from incremental import cumulative_path, merge_liushui
+
+def write_new(path, rows):
+    workbook = Workbook()
+    sheet = workbook.active
+    sheet.append(["交易日期", "摘要", "金额", "余额"])
+    for row in rows:
+        sheet.append(row)
+    workbook.save(path)
+
+def setup_cumulative(download_path):
+    target = cumulative_path(download_path, "项目A")
+    os.makedirs(os.path.dirname(target))
+    # pandas 写出的累计文件：含空值的列为 float64（50 写成 50.0）
+    pd.DataFrame({
+        "交易日期": ["2026-10-01", "2026-10-02", "2026-10-02"],
+        "摘要": ["a", "b", "c"],
+        "金额": [50, 20, 30],
+        "余额": [100.0, None, 150.0],
+    }).to_excel(target, index=False)
+    return target
+
+def test_resync_does_not_duplicate_rows(tmp_path):
+    target = setup_cumulative(str(tmp_path))
+    new_file = os.path.join(tmp_path, "new.xlsx")
+    # 重新同步 2026-10-02：b、c 已在累计文件中，d 是新交易，另有两笔完全相同的手续费
+    write_new(new_file, [
+        ["2026-10-02", "b", 20, None],
+        ["2026-10-02", "c", 30, 150],
+        ["2026-10-02", "d", 40, 190],
+        ["2026-10-03", "手续费", 5, 185],
+        ["2026-10-03", "手续费", 5, 185],
+    ])
+    assert merge_liushui(str(tmp_path), "项目A", new_file) == 3
+    rows = list(load_workbook(target).active.iter_rows(values_only=True))[1:]
+    assert [row[1] for row in rows] == ["a", "b", "c", "d", "手续费", "手续费"]
+    # 再次合并同一文件不新增任何行
+    assert merge_liushui(str(tmp_path), "项目A", new_file) == 0
+
+def test_first_merge_keeps_identical_rows(tmp_path):
+    os.makedirs(os.path.dirname(cumulative_path(str(tmp_path), "项目A")))
+    new_file = os.path.join(tmp_path, "new.xlsx")
+    write_new(new_file, [["2026-10-03", "手续费", 5, None], ["2026-10-03", "手续费", 5, None]])
+    assert merge_liushui(str(tmp_path), "项目A", new_file) == 2
@@ -0,0 +1,26 @@
+import os
+from openpyxl import Workbook, load_workbook
+from pagination import merge_slices
+
+def write_slice(path, rows):
+    workbook = Workbook()
+    sheet = workbook.active
+    sheet.append(["交易日期", "账号", "金额"])
+    for row in rows:
+        sheet.append(row)
+    workbook.save(path)
+
+def test_merge_slices_keeps_long_accounts_and_removes_slices(tmp_path):
+    parts = [os.path.join(tmp_path, f"slice_{i:02d}.xlsx") for i in (1, 2)]
+    write_slice(parts[0], [["2025-01-02", "6222000011112222333", 1], ["2025-01-02", "6222000011112222333", 1]])
+    write_slice(parts[1], [["2025-01-03", "6222000011112222333", 2.25]])
+    target = os.path.join(tmp_path, "merged.xlsx")
+    assert merge_slices(parts, target) == 3
+    rows = list(load_workbook(target).active.iter_rows(values_only=True))
+    # 两笔相同的交易都保留
+    assert rows[1:] == [
+        ("2025-01-02", "6222000011112222333", 1),
+        ("2025-01-02", "6222000011112222333", 1),
+        ("2025-01-03", "6222000011112222333", 2.25),
+    ]
+    assert not any(os.path.exists(p) for p in parts)
@@ -0,0 +1,16 @@
+from supervisor import BrowserCrashed, run_supervised
+
+def test_relaunch_failure_returns_partial_totals():
+    jobs = [("项目A", "1"), ("项目B", "2"), ("项目C", "3")]
+    messages = []
+
+    def start(restarts):
+        if restarts:
+            raise RuntimeError("浏览器无法启动")
+        return "page"
+
+    def run(page, remaining):
+        raise BrowserCrashed(remaining[1:], 1, 0)
+
+    assert run_supervised(jobs, start, run, messages.append) == (1, 2, 1)
+    assert "剩余 2 个任务记为失败" in messages[-1]
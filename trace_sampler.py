@@ -0,0 +1,57 @@
+import os
+import time
+import statistics
+
+# 抽样追踪：每个账号录制一段 Playwright trace，只保留失败或明显变慢（超过此前成功账号耗时中位数 N 倍）的账号，
+# 其余丢弃；保留的 trace 可用 playwright show-trace 查看
+TRACE_DIR = "traces"
+# 至少有这么多成功账号后才按中位数判断是否变慢
+WARMUP_ACCOUNTS = 3
+
+class TraceSampler:
+    """按账号分段录制上下文的 trace，每个页面一个"""
+
+    def __init__(self, context, download_path, log_local, factor=3.0):
+        self.context = context
+        self.trace_dir = os.path.join(download_path, "导出日志", TRACE_DIR)
+        os.makedirs(self.trace_dir, exist_ok=True)
+        self.log_local = log_local
+        self.factor = factor
+        self.durations = []
+        self.kept = 0
+        self.started = None
+        context.tracing.start(screenshots=True, snapshots=True)
+
+    def begin(self, job):
+        """开始录制一个账号"""
+        self.context.tracing.start_chunk(title=" ".join(job))
+        self.started = time.monotonic()
+
+    def end(self, job, ok):
+        """结束录制：失败或变慢时保存 trace 并返回路径，否则丢弃返回 None"""
+        seconds = time.monotonic() - self.started
+        reason = None
+        if not ok:
+            reason = "失败"
+        elif len(self.durations) >= WARMUP_ACCOUNTS and seconds > self.factor * statistics.median(self.durations):
+            reason = "变慢"
+        if ok:
+            self.durations.append(seconds)
+        if reason is None:
+            self.context.tracing.stop_chunk()
+            return None
+        xiangmu, account, kaishiriqi, jieshuriqi = job
+        path = os.path.join(self.trace_dir, f"{xiangmu}_{account}_{kaishiriqi}_{jieshuriqi}_{reason}_{int(time.time())}.zip")
+        self.context.tracing.stop_chunk(path=path)
+        self.kept += 1
+        self.log_local(f"账号{reason}（耗时 {seconds:.1f} 秒），已保存 trace：{os.path.basename(path)}")
+        return path
+
+    def close(self):
+        """停止录制（浏览器已崩溃时忽略错误）"""
+        try:
+            self.context.tracing.stop()
+        except Exception:
+            pass
+        if self.kept:
+            self.log_local(f"共保留 {self.kept} 个 trace，目录：{self.trace_dir}")
@@ -1,11 +1,20 @@
 import os
 import time
 import configparser
+import threading
 import numpy as np
 import cv2
 import pyautogui
 from pywinauto import Desktop, Application
 from datetime import datetime
+from waits import Waiter, file_ready
+from spans import timed
+
+_log_lock = threading.Lock()
+
+OVERWRITE_TITLE_RE = ".*文件已存在.*|.*确认保存.*|.*确认另存为.*|.*Confirm Save.*|.*Replace.*"
+
+_template_cache = {}
 
 def log(message, base_path, log_callback=None):
     """记录日志到文件和回调函数"""
@@ -13,8 +22,9 @@ def log(message, base_path, log_callback=None):
     log_dir = os.path.join(base_path, "导出日志")
     os.makedirs(log_dir, exist_ok=True)
     log_file = os.path.join(log_dir, "导出错误日志.txt")
-    with open(log_file, "a", encoding="utf-8") as f:
-        f.write(f"{datetime.now()}: {message}\n")
+    with _log_lock:
+        with open(log_file, "a", encoding="utf-8") as f:
+            f.write(f"{datetime.now()}: {message}\n")
     if log_callback:
         log_callback(message)
 
@@ -36,6 +46,60 @@ def read_bank_config(project_root):
         raise ValueError("ningbo_bank 配置不完整，请检查 config.txt")
     return username, password, login_url, config_path
 
+# config.txt 中 [run] 段的可选运行参数及默认值，取值类型以默认值为准
+RUN_OPTION_DEFAULTS = {
+    "workers": 1,
+    "print_mode": "desktop",  # desktop: 打印预览+图像识别; pdf: 浏览器直接渲染 PDF（无头）; none: 不打印
+    "engine": "sync",  # sync: 同步引擎（支持多线程）; async: asyncio 引擎
+    "concurrency": 4,  # async 引擎同时处理的账号数
+    "export_mode": "ui",  # ui: 页面点击导出; capture: 点击导出并录制接口; api: 直接调用录制的接口，失败回退页面
+    "incremental": False,  # 只导出每个账号尚未合并进项目累计流水的日期，并追加到累计流水
+    "chunk": "none",  # none/month/week：长日期范围按自然月或自然周分段并发导出
+    "pipeline": False,  # 下载文件交给后台线程复制、校验、登记，页面直接处理下一个账号
+    "dedup": False,  # 导出文件按内容哈希存入 <下载目录>/.blobs，项目目录下为硬链接，重复内容不再占用磁盘
+    "account_index": False,  # 缓存账户树中账号节点的位置，直接点击选中账号，未命中时才输入搜索
+    "batch_size": 1,  # 大于 1 时多选一组账号一次导出流水再按账号列拆分（需账户树支持多选）
+    "parallel_downloads": False,  # 连续触发回单和流水导出，两个下载同时进行
+    "paginate": False,  # 查询结果分页时先调大每页条数，仍有多页则逐页导出并合并流水
+    "session_guard": False,  # 运行中发现会话失效（401、跳回登录页）时原地重新登录并重试当前账号
+    "max_restarts": 2,  # 浏览器崩溃后每个线程最多重启的次数，重启后从失败的账号继续
+    "trace": False,  # 按账号录制 Playwright trace，只保留失败或变慢账号的 trace 到 导出日志/traces
+    "trace_factor": 3.0,  # 账号耗时超过此前成功账号中位数的倍数时视为变慢
+    "error_max_per_run": 50,  # 每次运行最多保存的错误截图数（存于 <下载目录>/errors/<运行编号>/）
+    "error_max_per_project": 5,  # 每个项目每次运行最多保存的错误截图数
+    "recycle_every": 0,  # 每处理这么多个账号换用一个新页面，0 为不按数量回收
+    "recycle_heap_mb": 0,  # 页面 JS 堆超过该值（MB）时换用新页面，0 为不检查（如 300）
+    "recycle_nodes": 0,  # 页面 DOM 节点数超过该值时换用新页面，0 为不检查（如 200000）
+    "browser_daemon": False,  # 连接常驻浏览器复用登录状态，省去每次启动浏览器和登录（pdf 打印模式不适用）
+    "block_resources": False,  # 登录后拦截图片、媒体、字体和第三方统计请求
+    "block_types": "image,media,font",  # 拦截的资源类型，逗号分隔
+    "block_allow": "",  # 额外放行的 URL 正则，逗号分隔（下载/导出接口默认放行）
+}
+
+def read_run_options(project_root):
+    """读取 config.txt 中可选的 [run] 运行参数，缺省时使用默认值"""
+    options = dict(RUN_OPTION_DEFAULTS)
+    config_path = os.path.join(project_root, "config.txt")
+    if not os.path.exists(config_path):
+        return options
+    config = configparser.ConfigParser()
+    config.read(config_path, encoding="utf-8")
+    if "run" not in config:
+        return options
+    run_conf = config["run"]
+    for key, default in RUN_OPTION_DEFAULTS.items():
+        if key not in run_conf:
+            continue
+        if isinstance(default, bool):
+            options[key] = run_conf.getboolean(key)
+        elif isinstance(default, int):
+            options[key] = run_conf.getint(key)
+        elif isinstance(default, float):
+            options[key] = run_conf.getfloat(key)
+        else:
+            options[key] = run_conf.get(key).strip()
+    return options
+
 def get_resource_path(relative_path, project_root, subfolder="seek"):
     """获取资源文件的绝对路径，始终从项目根目录加载"""
     # config.txt 在项目根目录，图像文件在 seek/
@@ -48,55 +112,82 @@ def get_resource_path(relative_path, project_root, subfolder="seek"):
         return full_path
     raise FileNotFoundError(f"资源文件不存在: {full_path}")
 
-def find_and_click_image(template_path, base_path, offset_x=0, offset_y=0, threshold=0.5, max_attempts=10):
-    """使用模板匹配找到图像并点击"""
-    for attempt in range(max_attempts):
-        screenshot = pyautogui.screenshot()
-        screenshot = cv2.cvtColor(np.array(screenshot), cv2.COLOR_RGB2BGR)
+def load_template(template_path):
+    """读取并缓存模板图像，失败返回 None"""
+    if template_path not in _template_cache:
         if not os.path.exists(template_path):
-            log(f"模板路径不存在: {template_path}", base_path)
-            return None
-        try:
-            template = cv2.imdecode(np.fromfile(template_path, dtype=np.uint8), cv2.IMREAD_COLOR)
-        except Exception as e:
-            log(f"模板加载异常: {template_path}, 错误: {e}", base_path)
-            return None
-        if template is None:
-            log(f"无法加载模板图像: {template_path}", base_path)
             return None
-        result = cv2.matchTemplate(screenshot, template, cv2.TM_CCOEFF_NORMED)
-        min_val, max_val, min_loc, max_loc = cv2.minMaxLoc(result)
-        if max_val >= threshold:
-            x, y = max_loc
-            pyautogui.click(x + offset_x + template.shape[1] // 2, y + offset_y + template.shape[0] // 2)
+        _template_cache[template_path] = cv2.imdecode(np.fromfile(template_path, dtype=np.uint8), cv2.IMREAD_COLOR)
+    return _template_cache[template_path]
+
+@timed("图像识别")
+def locate_image(template_path, threshold=0.5):
+    """在当前屏幕上查找模板图像，返回 (x, y, 宽, 高)，未找到返回 None"""
+    template = load_template(template_path)
+    if template is None:
+        return None
+    screenshot = cv2.cvtColor(np.array(pyautogui.screenshot()), cv2.COLOR_RGB2BGR)
+    result = cv2.matchTemplate(screenshot, template, cv2.TM_CCOEFF_NORMED)
+    min_val, max_val, min_loc, max_loc = cv2.minMaxLoc(result)
+    if max_val >= threshold:
+        return (max_loc[0], max_loc[1], template.shape[1], template.shape[0])
+    return None
+
+def click_image_center(pos):
+    """点击 locate_image 返回区域的中心"""
+    x, y, width, height = pos
+    pyautogui.click(x + width // 2, y + height // 2)
+
+@timed("图像点击")
+def find_and_click_image(template_path, base_path, offset_x=0, offset_y=0, threshold=0.5, max_attempts=10, interval=1):
+    """使用模板匹配找到图像并点击"""
+    if not os.path.exists(template_path):
+        log(f"模板路径不存在: {template_path}", base_path)
+        return None
+    try:
+        template = load_template(template_path)
+    except Exception as e:
+        log(f"模板加载异常: {template_path}, 错误: {e}", base_path)
+        return None
+    if template is None:
+        log(f"无法加载模板图像: {template_path}", base_path)
+        return None
+    for attempt in range(max_attempts):
+        pos = locate_image(template_path, threshold)
+        if pos:
+            x, y, width, height = pos
+            pyautogui.click(x + offset_x + width // 2, y + offset_y + height // 2)
             log(f"第{attempt+1}次尝试成功，点击位置: ({x + offset_x}, {y + offset_y})", base_path)
             return (x, y)
-        time.sleep(1)
+        time.sleep(interval)
     log(f"未找到模板: {template_path}，尝试次数: {max_attempts}", base_path)
     return None
 
+@timed("覆盖确认")
 def handle_overwrite_dialog(base_path):
     """处理文件覆盖对话框"""
     try:
         app = Desktop(backend="win32")
-        dialog = app.window(title_re=".*文件已存在.*|.*确认保存.*|.*确认另存为.*|.*Confirm Save.*|.*Replace.*")
+        dialog = app.window(title_re=OVERWRITE_TITLE_RE)
         dialog.wait("exists ready", timeout=5)
         dialog.set_focus()
         replace_btn = dialog.child_window(title_re="是.*|替换.*|Yes.*|Replace.*", class_name="Button")
         replace_btn.wait("exists enabled visible ready", timeout=3)
         replace_btn.click()
-        time.sleep(1)
     except Exception as e:
         log(f"未检测到覆盖确认窗口或点击失败: {e}", base_path)
 
-def handle_save_dialog(save_path, pdf_filename, base_path):
-    """处理保存对话框"""
+@timed("另存为对话框")
+def handle_save_dialog(save_path, pdf_filename, base_path, waiter=None):
+    """处理保存对话框，等到文件实际写完才返回"""
+    waiter = waiter or Waiter()
     full_path = os.path.join(save_path, pdf_filename)
     log(f"尝试捕捉‘另存为’窗口，目标路径: {full_path}", base_path)
     try:
         desktop = Desktop(backend="win32")
-        dialogs = desktop.windows(title_re="^另存为$")
-        if not dialogs:
+        try:
+            dialogs = waiter.until("另存为窗口", lambda: desktop.windows(title_re="^另存为$"))
+        except TimeoutError:
             raise Exception("未找到标题为 '另存为' 的窗口")
         for i, dlg_wrapper in enumerate(dialogs):
             try:
@@ -104,17 +195,24 @@ def handle_save_dialog(save_path, pdf_filename, base_path):
                 app = Application(backend="win32").connect(handle=handle)
                 dlg = app.window(handle=handle)
                 dlg.set_focus()
-                time.sleep(0.3)
                 edit = dlg.child_window(class_name="Edit")
+                edit.wait("exists enabled visible ready", timeout=3)
                 edit.set_focus()
                 edit.set_edit_text(full_path)
+                waiter.until("填写保存路径", lambda: edit.window_text() == full_path, timeout=3)
                 log(f"窗口{i + 1}设置路径成功: {full_path}", base_path)
-                time.sleep(0.5)
                 save_btn = dlg.child_window(class_name="Button", title_re="保存|Save")
+                # 旧文件可能是去重存储的硬链接，Chrome 覆盖时会原地改写共享内容，先删除
+                if os.path.exists(full_path):
+                    os.remove(full_path)
+                prior_mtime = None
                 save_btn.click()
                 log(f"点击保存按钮完成", base_path)
-                time.sleep(3)
-                handle_overwrite_dialog(base_path)
+                # 目标文件已存在时会先弹出覆盖确认窗口，否则直接开始写文件
+                outcome = waiter.until("文件写入", lambda: "confirm" if desktop.windows(title_re=OVERWRITE_TITLE_RE) else file_ready(full_path, prior_mtime))
+                if outcome == "confirm":
+                    handle_overwrite_dialog(base_path)
+                waiter.file(full_path, min_mtime=prior_mtime)
                 return
             except Exception as inner_e:
                 log(f"窗口{i + 1}处理失败: {inner_e}", base_path)
@@ -0,0 +1,161 @@
+import os
+import time
+import threading
+from contextlib import contextmanager
+import spans
+
+# 事件驱动等待：按真实条件（元素状态、网络空闲、下载开始、窗口出现、文件写完）等待，记录每次等待的实际耗时
+
+# 各步骤默认超时（秒），Waiter(timeouts=...) 可覆盖
+WAIT_TIMEOUTS = {
+    "搜索结果": 15,
+    "查询结果": 10,
+    "导出菜单": 10,
+    "下载开始": 120,
+    "网络空闲": 30,
+    "对账单打印按钮": 15,
+    "目标打印机": 15,
+    "另存为PDF": 10,
+    "保存按钮": 10,
+    "另存为窗口": 15,
+    "文件写入": 30,
+}
+DEFAULT_TIMEOUT = 30
+
+def wait_until(predicate, timeout, interval=0.2):
+    """轮询直到 predicate 返回真值并返回该值，超时返回 None"""
+    deadline = time.monotonic() + timeout
+    while True:
+        result = predicate()
+        if result:
+            return result
+        if time.monotonic() >= deadline:
+            return None
+        time.sleep(interval)
+
+def file_ready(path, min_mtime=None):
+    """文件存在、非空，且（给定时）修改时间晚于 min_mtime"""
+    if not os.path.exists(path):
+        return False
+    stat = os.stat(path)
+    if stat.st_size <= 0:
+        return False
+    return min_mtime is None or stat.st_mtime > min_mtime
+
+class Waiter:
+    """带分步超时和耗时记录的等待器，每个页面/线程一个"""
+
+    def __init__(self, timeouts=None):
+        self.timeouts = dict(WAIT_TIMEOUTS)
+        if timeouts:
+            self.timeouts.update(timeouts)
+        self.records = []
+        self.lock = threading.Lock()
+
+    def timeout(self, step, timeout=None):
+        """步骤超时（秒）"""
+        if timeout is not None:
+            return timeout
+        return self.timeouts.get(step, DEFAULT_TIMEOUT)
+
+    def _record(self, step, seconds, ok):
+        with self.lock:
+            self.records.append((step, seconds, ok))
+        spans.record(f"等待:{step}", seconds, ok)
+
+    @contextmanager
+    def measure(self, step):
+        """记录一段等待的耗时"""
+        started = time.monotonic()
+        ok = False
+        try:
+            yield
+            ok = True
+        finally:
+            self._record(step, time.monotonic() - started, ok)
+
+    def until(self, step, predicate, timeout=None, interval=0.2):
+        """轮询条件，超时抛出 TimeoutError"""
+        with self.measure(step):
+            result = wait_until(predicate, self.timeout(step, timeout), interval)
+            if not result:
+                raise TimeoutError(f"等待{step}超时（{self.timeout(step, timeout)} 秒）")
+            return result
+
+    def selector(self, locator, step, state="visible", timeout=None):
+        """等待 Playwright 定位器达到指定状态"""
+        with self.measure(step):
+            locator.wait_for(state=state, timeout=self.timeout(step, timeout) * 1000)
+        return locator
+
+    def network_idle(self, page, step="网络空闲", timeout=None):
+        """等待页面网络空闲"""
+        with self.measure(step):
+            page.wait_for_load_state("networkidle", timeout=self.timeout(step, timeout) * 1000)
+
+    @contextmanager
+    def download(self, page, step="下载开始", timeout=None):
+        """包裹触发下载的操作，等待下载事件，用法同 page.expect_download"""
+        started = time.monotonic()
+        ok = False
+        try:
+            with page.expect_download(timeout=self.timeout(step, timeout) * 1000) as download_info:
+                yield download_info
+            ok = True
+        finally:
+            self._record(step, time.monotonic() - started, ok)
+
+    def file(self, path, step="文件写入", timeout=None, min_mtime=None, stable=0.3):
+        """等待文件写完：存在、非空且大小在 stable 秒内不再变化"""
+        def written():
+            if not file_ready(path, min_mtime):
+                return False
+            size = os.path.getsize(path)
+            time.sleep(stable)
+            return os.path.exists(path) and os.path.getsize(path) == size
+        return self.until(step, written, timeout)
+
+    def summary(self):
+        """按步骤汇总：{步骤: (次数, 总耗时, 最长耗时, 超时次数)}"""
+        result = {}
+        with self.lock:
+            for step, seconds, ok in self.records:
+                count, total, longest, failures = result.get(step, (0, 0.0, 0.0, 0))
+                result[step] = (count + 1, total + seconds, max(longest, seconds), failures + (0 if ok else 1))
+        return result
+
+    def log_summary(self, log_local):
+        """把等待耗时统计写入日志"""
+        for step, (count, total, longest, failures) in sorted(self.summary().items()):
+            log_local(f"等待统计 {step}：{count} 次，平均 {total / count:.2f} 秒，最长 {longest:.2f} 秒，超时 {failures} 次")
+
+class DownloadTracker:
+    """监听页面的下载事件：可以先后触发多个下载，再按条件逐个取回，多个下载在浏览器中同时进行"""
+
+    def __init__(self, page, waiter):
+        self.page = page
+        self.waiter = waiter
+        self.pending = []
+        self._handler = self.pending.append
+        page.on("download", self._handler)
+
+    def take(self, predicate, step="下载开始", timeout=None):
+        """取回第一个满足 predicate 的下载（已发生的或之后发生的），超时抛出 TimeoutError"""
+        deadline = time.monotonic() + self.waiter.timeout(step, timeout)
+        with self.waiter.measure(step):
+            while True:
+                for download in self.pending:
+                    if predicate(download):
+                        self.pending.remove(download)
+                        return download
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise TimeoutError(f"等待{step}超时（{self.waiter.timeout(step, timeout)} 秒）")
+                try:
+                    # 同步接口只在调用 Playwright 时分发事件，等待期间新下载由监听器收集
+                    self.page.wait_for_event("download", timeout=remaining * 1000)
+                except Exception:
+                    pass
+
+    def close(self):
+        self.page.remove_listener("download", self._handler)